@@ -0,0 +1,420 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Lock
+from time import perf_counter, monotonic
+from urllib.parse import urlparse
+import httpx
+import http_client
+import scheduler
+import render_detection
+import recipe_finder
+import matching
+from generate_html import html_to_recipe, file_name, settled_match, NOT_WAITED
+from render_html import create_minimized_html
+from instrumentation import stage, count
+
+MAX_CONNECTIONS = 100  # connections open at the same time, shared by every conversion of the event loop
+BROWSER_WORKERS = None  # pages rendered at the same time (browsers of get_html_selenium.pool), None: MAX_BROWSERS
+
+# EXCEPTIONS (code: same value as the error codes of generate_html.py)
+class ConversionError(Exception):
+    """
+    A recipe could not be converted
+    """
+    code = None
+
+
+class RecipeNotFound(ConversionError):
+    """
+    The page has no recipe
+    """
+    code = 0
+
+
+class RecipeParseError(ConversionError):
+    """
+    The recipe of the page could not be parsed
+    """
+    code = -1
+
+
+class InternalError(RecipeParseError):
+    """
+    This program failed, not the website (e.g. no browser driver), such failures do not count against the website
+    """
+
+
+class DishNotFound(ConversionError):
+    """
+    No website has a recipe for the dish name
+    """
+    code = -2
+
+
+class NetworkError(ConversionError):
+    """
+    A page could not be downloaded
+    """
+    code = -3
+
+
+ERRORS = {error.code: error for error in (RecipeNotFound, RecipeParseError, DishNotFound, NetworkError)}
+
+
+@dataclass(frozen=True)
+class ConversionResult:
+    """
+    A converted recipe
+    """
+    name: str  # file name of the dish, with the website for dish names (see name_to_recipe)
+    html: str  # the HTML markdown of the recipe
+    recipe: dict  # the standardized recipe dictionary
+    url: str  # the web link of the recipe (<link rel="canonical"> of the page if it has one)
+    score: int = None  # similarity score to the dish name (smaller is better), None for links
+
+
+_client = None  # (event loop, shared httpx.AsyncClient)
+_executor = None
+_lock = Lock()
+
+
+def client():
+    """
+    Get the shared client of the running event loop, created on first use (one connection pool for every conversion)
+    :return: the shared client; httpx.AsyncClient
+    """
+    global _client
+    loop = asyncio.get_running_loop()
+    if _client is None or _client[0] is not loop or _client[1].is_closed:
+        _client = (loop, httpx.AsyncClient(
+            headers={"User-Agent": http_client.USER_AGENT, "Accept-Encoding": http_client.ACCEPT_ENCODING},
+            timeout=httpx.Timeout(http_client.TIMEOUT[1], connect=http_client.TIMEOUT[0]),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=http_client.POOL_SIZE),
+            transport=httpx.AsyncHTTPTransport(retries=http_client.RETRY.connect), follow_redirects=True))
+    return _client[1]
+
+
+async def aclose():
+    """
+    Closes the shared client, e.g. when the web service shuts down
+    :return: None
+    """
+    global _client
+    if _client is not None:
+        await _client[1].aclose()
+        _client = None
+
+
+def browser_executor():
+    """
+    Get the executor running the browser fallback, created on first use: at most BROWSER_WORKERS pages are rendered
+    at the same time, the event loop never waits for the browser
+    :return: the executor; ThreadPoolExecutor
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            import get_html_selenium
+            size = BROWSER_WORKERS or get_html_selenium.MAX_BROWSERS
+            if get_html_selenium.pool.size != size:  # one browser per thread, a thread never waits for a browser
+                get_html_selenium.configure_pool(size)
+            _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="browser")
+        return _executor
+
+
+# PIPELINE
+async def afetch(url, http=None):
+    """
+    Downloads a web page without blocking the event loop (the disk cache of http_cache.py is not used), the request
+    waits for the limits of its host and robots.txt like the synchronous ones (see scheduler.aslot)
+    :param url: the web link; str
+    :param http: (optional) client to use instead of the shared one; httpx.AsyncClient
+    :return: the page text; str
+    """
+    http = http or client()
+    try:
+        await scheduler.acheck_robots(url)
+    except scheduler.RobotsDisallowed as e:
+        raise NetworkError("Could not download {}: {}".format(url, e)) from e
+    start = perf_counter()
+    status = None
+    try:
+        for attempt in range(http_client.BUSY_RETRIES + 1):
+            async with scheduler.aslot(url) as slot:  # waits for the Retry-After of the previous attempt
+                slot.response = r = await http.get(url if http_client.url_rewriter is None
+                                                   else http_client.url_rewriter(url))
+            if attempt == http_client.BUSY_RETRIES or not scheduler.busy(r):
+                break
+        status = r.status_code
+        return r.text
+    except httpx.HTTPError as e:
+        raise NetworkError("Could not download {}: {}".format(url, e)) from e
+    finally:
+        http_client.record(url, status, perf_counter() - start, 0 if status is None else len(r.content))
+
+
+async def aget_html(url, http=None):
+    """
+    Asynchronous generate_html.get_html: the browser fallback runs in browser_executor(), the domain decisions are
+    written to disk in the default executor
+    :param url: the web link; str
+    :param http: (optional) client to use instead of the shared one; httpx.AsyncClient
+    :return: the HTML markdown; str
+    """
+    loop = asyncio.get_running_loop()
+    decision = render_detection.needs_browser(url)
+    if decision:  # domain is known to need JS, skip the static download
+        render_detection.count("browser_direct")
+    else:
+        with stage("download", url):
+            text = await afetch(url, http)
+        if render_detection.has_recipe_data(text):  # static page is enough
+            render_detection.count("static_hits")
+            await loop.run_in_executor(None, render_detection.record, url, False)
+            return text
+        render_detection.count("static_misses")
+        if decision is False and not render_detection.recheck(url):
+            return text  # domain serves recipes statically, this page simply has none
+
+    from get_html_selenium import get_html_selenium
+    from selenium.common.exceptions import WebDriverException
+    render_detection.count("browser_runs")
+    try:
+        with stage("browser fallback", url):
+            html = await loop.run_in_executor(browser_executor(), get_html_selenium, url, True)
+    except (WebDriverException, OSError) as e:  # browser could not load the page
+        raise NetworkError("Could not render {}: {}".format(url, e)) from e
+    if render_detection.has_recipe_data(html):  # recipe only appears after rendering
+        await loop.run_in_executor(None, render_detection.record, url, True)
+    return html
+
+
+async def arecipe(url, http=None):
+    """
+    Asynchronous generate_html.url_to_recipe
+    :param url: the web link to the recipe; str
+    :param http: (optional) client to use instead of the shared one; httpx.AsyncClient
+    :return: three-tuple (name, recipe, url), see url_to_recipe
+    """
+    with stage("get_html", url):
+        html = await aget_html(url, http)
+    val = html_to_recipe(html, url)
+    if type(val) is not tuple:
+        raise ERRORS[val]("{}: {}".format(url, "no recipe in the page" if val == 0 else "could not parse the recipe"))
+    return val
+
+
+async def aurl_to_html(url, http=None):
+    """
+    Converts a web link to the recipe HTML without blocking the event loop
+    :param url: the web link to the recipe; str
+    :param http: (optional) client to use instead of the shared one; httpx.AsyncClient
+    :return: the converted recipe; ConversionResult
+    :raise ConversionError: RecipeNotFound, RecipeParseError or NetworkError
+    """
+    name, recipe, url = await arecipe(url, http)
+    with stage("render"):
+        return ConversionResult(name, create_minimized_html(recipe)[0], recipe, url)
+
+
+class _ATitleBoard:
+    """
+    Asynchronous generate_html._TitleBoard: closest search result title over the websites of one search
+    """
+    def __init__(self, websites, wait):
+        """
+        :param websites: number of websites searched; int
+        :param wait: seconds to wait for the search results of the other websites; float
+        """
+        self._pending = websites
+        self._best = None
+        self._done = asyncio.Event()
+        self._deadline = monotonic() + wait
+        self.skipped = []  # (title score, index, link) of the recipe pages not downloaded
+
+    def post(self, score):
+        """
+        Adds the closest title of one website
+        :param score: similarity score of the title, None if the website has no results or failed; int
+        :return: None
+        """
+        self._pending -= 1
+        if score is not None and (self._best is None or score < self._best):
+            self._best = score
+        if self._pending <= 0:
+            self._done.set()
+
+    async def worth_downloading(self, score):
+        """
+        Waits for the search results of the other websites (at most until the deadline), then compares the titles
+        :param score: similarity score of the title of this website; int
+        :return: True if no other website has a clearly closer title; bool
+        """
+        try:
+            await asyncio.wait_for(self._done.wait(), max(self._deadline - monotonic(), 0))
+        except asyncio.TimeoutError:
+            pass
+        return self._best is None or score <= self._best + recipe_finder.TITLE_MARGIN
+
+    def skip(self, score, index, link):
+        """
+        Remembers a recipe page not downloaded, see generate_html._TitleBoard.skip
+        :param score: similarity score of the title; int
+        :param index: position of the website in the searched list; int
+        :param link: the web link of the recipe page; str
+        :return: None
+        """
+        self.skipped.append((score, index, link))
+
+
+async def _acheck_site(finder, index, name, http, board, known_recipe):
+    """
+    Worker for aname_to_html, finds the search result closest to the name on one website and converts it
+    :param finder: the website to search; recipe_finder.Finder
+    :param index: position of the website in the searched list; int
+    :param name: the dish name; str
+    :param http: client to use, or None for the shared one; httpx.AsyncClient
+    :param board: the closest titles of this search; _ATitleBoard
+    :param known_recipe: function giving the standardized dictionary of an already imported link (run in the default
+                         executor, e.g. a SQLite lookup), or None
+    :return: four-tuple (index, link, three-tuple (name, recipe, url), ConversionError or None if the recipe page
+             was not downloaded, seconds)
+    """
+    start = monotonic()
+    link = None
+    posted = False
+    try:
+        with stage("search page", finder.website):
+            best = recipe_finder.best_result(name, finder.parse(await afetch(finder.search_url.format(name), http)))
+        board.post(None if best is None else best[0])
+        posted = True
+        if best is None:
+            val = DishNotFound('No results for "{}" on {}'.format(name, finder.website))
+        else:
+            score, link, title = best
+            recipe = None if known_recipe is None else await asyncio.get_running_loop().run_in_executor(
+                None, known_recipe, link)
+            if recipe is not None:  # already imported, no need to download the recipe page
+                count("known_pages")
+                val = file_name(recipe), recipe, link
+            elif await board.worth_downloading(score):
+                val = await arecipe(link, http)
+            else:  # other websites have closer titles
+                count("pages_skipped")
+                board.skip(score, index, link)
+                val = None
+    except ConversionError as e:
+        val = e
+    except Exception as e:  # error of this program (e.g. no browser driver), not of the website
+        val = InternalError("{}: {}: {}".format(finder.website, type(e).__name__, e))
+        val.__cause__ = e
+    if not posted:  # do not keep the other websites waiting
+        board.post(None)
+    return index, link, val, monotonic() - start
+
+
+async def _asearch(finders, name, http, site_timeout, exact_distance, known_recipe):
+    """
+    Searches websites concurrently and records every lookup in the recipe_finder statistics
+    :param finders: the websites to search; list of recipe_finder.Finder
+    :param name: the dish name; str
+    :param http: client to use, or None for the shared one; httpx.AsyncClient
+    :param site_timeout: seconds to wait for the websites before giving up on the remaining ones; float
+    :param exact_distance: stop waiting for other websites once a result is this close to the name; int
+    :param known_recipe: function giving the standardized dictionary of an already imported link, or None
+    :return: two-tuple (outcomes, skipped) -- (link, val, similarity score) per website, None if it did not finish,
+             NOT_WAITED if it comes after a near-exact match (see generate_html.settled_match); (title score, index,
+             link) of the recipe pages not downloaded because other websites have closer titles
+    """
+    board = _ATitleBoard(len(finders), min(recipe_finder.SEARCH_WAIT, site_timeout))
+    tasks = [asyncio.ensure_future(_acheck_site(finder, index, name, http, board, known_recipe))
+             for index, finder in enumerate(finders)]
+    outcomes = [None] * len(finders)
+    try:
+        for future in asyncio.as_completed(tasks, timeout=site_timeout):
+            index, link, val, seconds = await future
+            score = matching.similarity(name, val[0]) if type(val) is tuple else None
+            outcomes[index] = (link, val, score)
+            code = val.code if isinstance(val, ConversionError) else val
+            if not isinstance(val, InternalError):  # failures of this program do not count against the website
+                recipe_finder.record(finders[index].website, recipe_finder.outcome(link, code), seconds)
+            match = settled_match(outcomes, exact_distance)
+            if match is not None:  # near-exact match, later websites cannot win: ignore them even if they answered
+                outcomes[match + 1:] = [NOT_WAITED] * (len(outcomes) - match - 1)
+                break
+    except asyncio.TimeoutError:  # remaining websites timed out, they count as errors for their circuit breakers
+        for finder, outcome in zip(finders, outcomes):
+            if outcome is None:
+                recipe_finder.record(finder.website, "error", site_timeout)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return outcomes, board.skipped
+
+
+async def aname_to_html(name, http=None, site_timeout=120, exact_distance=0, known_recipe=None):
+    """
+    Asynchronous generate_html.name_to_html: the websites are searched concurrently in the order of
+    recipe_finder.plan() (rarely winning websites only if the others have no recipe), recipe pages are downloaded for
+    the search results whose titles are closest to the name first (the others only if those have no recipe), nothing
+    is printed
+    :param name: the dish name; str
+    :param http: (optional) client to use instead of the shared one; httpx.AsyncClient
+    :param site_timeout: seconds to wait for the websites before giving up on the remaining ones; float
+    :param exact_distance: stop waiting for other websites once a result is this close to the name; int
+    :param known_recipe: (optional) function giving the standardized dictionary of an already imported link, or None
+    :return: the closest recipe; ConversionResult
+    :raise ConversionError: error of the last website searched if no website has a recipe
+    """
+    first, fallback, skipped = recipe_finder.plan()
+    searched, outcomes, candidates = [], [], []
+    for finders in (first, fallback):
+        if not finders:
+            continue
+        found, skipped_pages = await _asearch(finders, name, http, site_timeout, exact_distance, known_recipe)
+        candidates += [(score, len(searched) + index, link) for score, index, link in skipped_pages]
+        searched += finders
+        outcomes += found
+        if any(outcome is not None and outcome[2] is not None for outcome in outcomes):  # found a recipe
+            break
+
+    # select in search order so the result does not depend on which website answered first
+    best = None
+    best_website = None
+    error = DishNotFound('No website answered in time for "{}"'.format(name))
+    for finder, outcome in zip(searched, outcomes):
+        if outcome is None or outcome is NOT_WAITED:
+            continue
+        link, val, score = outcome
+        if val is None:  # recipe page not downloaded
+            continue
+        if score is None:
+            error = val
+        elif best is None or score < best[2]:
+            best = outcome
+            best_website = finder.website
+    if best is None:  # the closer titles had no recipe: download the skipped pages, closest title first
+        for title_score, index, link in sorted(candidates):
+            try:
+                val = await arecipe(link, http)
+            except ConversionError as e:
+                error = e
+                continue
+            except Exception as e:  # error of this program, see _acheck_site
+                error = InternalError("{}: {}: {}".format(searched[index].website, type(e).__name__, e))
+                error.__cause__ = e
+                continue
+            best = link, val, matching.similarity(name, val[0])
+            best_website = searched[index].website
+            break
+    if best_website is not None:
+        recipe_finder.win(best_website)
+    await asyncio.get_running_loop().run_in_executor(None, recipe_finder.save)
+    if best is None:
+        raise error
+
+    link, (dish, recipe, url), score = best
+    with stage("render"):
+        return ConversionResult("{} (from {})".format(dish, urlparse(link).netloc), create_minimized_html(recipe)[0],
+                                recipe, url, score)
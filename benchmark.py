@@ -0,0 +1,598 @@
+# EXTERNAL LIBRARIES AND FUNCTIONS
+import json
+import sys
+from io import StringIO
+from os import path
+from contextlib import redirect_stdout
+from timeit import repeat
+
+FIXTURES_PATH = path.join(path.dirname(path.abspath(__file__)), "fixtures")
+GOLDEN_PATH = path.join(FIXTURES_PATH, "golden.json")  # expected results for the fixture pages, checked in
+BASELINE_PATH = path.join(FIXTURES_PATH, "baseline.json")  # throughput of this machine, saved with --save-baseline
+DISHES = ["spaghetti carbonara"]  # dish names with search page fixtures (see fixtures/routes.json)
+TOLERANCE = 0.3  # fail if a stage is more than 30% slower than the baseline
+STARTUP_BUDGET = 0.025  # seconds of imports allowed for the recipe.py commands below (python -X importtime)
+STARTUP_COMMANDS = ([], ["--search", "carbonara"])  # usage screen and offline library search
+HEAVY_MODULES = ("requests", "urllib3", "selenium", "httpx", "generate_html", "json_ld", "http_client")
+
+
+# REFERENCE IMPLEMENTATIONS (previous versions, kept only for comparison)
+def legacy_get_recipe(html, lookfor='"@type"'):
+    """
+    Previous generate_html.get_recipe: character-by-character brace scan, recurses on the rest of the page
+    :param html: the HTML code to parse
+    :param lookfor: (optional) where to start searching for the JSON object
+    :return: recipe JSON object
+    """
+    j = html.find(lookfor)
+    if j == -1:
+        return
+
+    counter = 1
+    while counter > 0:
+        j -= 1
+        if html[j] == "}":
+            counter += 1
+        elif html[j] == "{":
+            counter -= 1
+    start = j
+
+    counter = 1
+    while counter > 0:
+        j += 1
+        if html[j] == "{":
+            counter += 1
+        elif html[j] == "}":
+            counter -= 1
+
+    json_recipe = json.loads(html[start:j + 1])
+    try:
+        typ = json_recipe["@type"]
+    except KeyError:
+        if lookfor == '"@type":"Recipe"':
+            return
+        else:
+            return legacy_get_recipe(html, lookfor='"@type":"Recipe"')
+
+    if "Recipe" not in typ:
+        return legacy_get_recipe(html[j + 1:])
+    else:
+        return json_recipe
+
+
+def legacy_find(html):
+    """
+    Previous lookup sequence of url_to_html (specific "lookfor" first, then generic)
+    :param html: the HTML code to parse
+    :return: recipe JSON object
+    """
+    recipe = legacy_get_recipe(html, lookfor='"@type":"Recipe"')
+    if recipe is None:
+        recipe = legacy_get_recipe(html)
+    return recipe
+
+
+def legacy_levenshtein(str_a, str_b):
+    """
+    Previous recipe_finder.levenshtein: full (m+1)x(n+1) matrix
+    :param str_a: the first string; String
+    :param str_b: the second string; String
+    :return: the Levenshtein distance
+    """
+    m = len(str_a)
+    n = len(str_b)
+    d = [[0] * (n + 1) for _ in range(m + 1)]
+    for i in range(1, m + 1):
+        d[i][0] = i
+    for j in range(1, n + 1):
+        d[0][j] = j
+    for j in range(1, n + 1):
+        for i in range(1, m + 1):
+            cost = 0 if str_a[i - 1] == str_b[j - 1] else 1
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + cost)
+    return d[m][n]
+
+
+def legacy_clean_recipe(recipe_json):
+    """
+    Previous generate_html.clean_recipe: every JSON key checked against every keyword with substring tests
+    :param recipe_json: the recipe JSON object
+    :return: the standardized dictionary
+    """
+    cleaned = {}
+    key = {"totaltime": "totalTime", "cooktime": "cookTime", "preptime": "cookTime", "name": "name", "title": "name",
+           "article": "articleBody", "body": "articleBody", "description": "articleBody", "yield": "recipeYield",
+           "ingredient": "recipeIngredients", "instruction": "recipeInstructions"}
+    for recipe_key in recipe_json:
+        for keyword in key:
+            if keyword in recipe_key.lower():
+                value = recipe_json[recipe_key]
+                if key[keyword] in ("recipeIngredients", "recipeInstructions"):
+                    cleaned[key[keyword]] = value
+                elif type(value) is list:
+                    cleaned[key[keyword]] = value[0]
+                elif type(value) is dict:
+                    if "text" in value:
+                        cleaned[key[keyword]] = value["text"]
+                    elif "url" in value:
+                        cleaned[key[keyword]] = value["url"]
+                    else:
+                        return
+                else:
+                    cleaned[key[keyword]] = value
+
+    if type(cleaned["recipeInstructions"][0]) is dict:
+        cleaned_instructions = []
+        for i in cleaned["recipeInstructions"]:
+            if "text" in i:
+                cleaned_instructions.append(i["text"])
+            elif "itemListElement" in i:
+                cleaned_instructions.append("".join(t["text"] + "<br><br>" for t in i["itemListElement"]))
+            else:
+                cleaned_instructions.append(i)
+        cleaned["recipeInstructions"] = cleaned_instructions
+    for i in ["name", "articleBody", "cookTime", "totalTime", "recipeYield"]:
+        if cleaned.get(i) is None:
+            cleaned[i] = ""
+        if i in ("cookTime", "totalTime") and cleaned[i][:2] == "PT":
+            cleaned[i] = cleaned[i][2:]
+    return cleaned
+
+
+def legacy_parse_allrecipes_results(html):
+    """
+    Previous recipe_finder.parse_allrecipes_results: the page is sliced again for every gallery skipped, characters
+    are scanned one at a time, first link only
+    :param html: the search page; str
+    :return: recipe link; str, if no results return None
+    """
+    url = "gallery"
+    i = 0
+
+    while "gallery" in url:
+        html = html[i + 5:]
+        start = html.find('data-tax-levels href="')
+        i = start
+        x = 0
+        while x < 2:
+            if html[i] == '"':
+                x += 1
+            i += 1
+        url = html[start+22:i-1]
+
+    if "/" not in url:
+        return None
+    else:
+        return url
+
+
+# SYNTHETIC PAGES
+def synthetic_page(size=3_000_000, blocks=40):
+    """
+    Builds a large recipe page: filler markup, many non-recipe JSON-LD blocks, recipe JSON-LD block at the end
+    :param size: approximate page size in characters; int
+    :param blocks: number of non-recipe JSON-LD blocks before the recipe; int
+    :return: the HTML code; str
+    """
+    filler = '<div class="ad"><p>Lorem ipsum dolor sit amet</p></div>\n' * (size // 60 // (blocks + 1))
+    other = {"@context": "https://schema.org", "@type": "BreadcrumbList",
+             "itemListElement": [{"@type": "ListItem", "position": i, "name": "Crumb {}".format(i)} for i in range(5)]}
+    recipe = {"@context": "https://schema.org", "@graph": [
+        {"@type": "WebPage", "name": "Page"},
+        {"@type": ["Recipe", "NewsArticle"], "name": "Synthetic Pasta", "description": "A {braced} description",
+         "recipeYield": ["4", "4 servings"], "cookTime": "PT20M", "totalTime": "PT1H",
+         "recipeIngredient": ["{} g pasta".format(i) for i in range(20)],
+         "recipeInstructions": [{"@type": "HowToStep", "text": "Step {}".format(i)} for i in range(10)]}]}
+    parts = ["<html><head><title>Synthetic</title></head><body>"]
+    for _ in range(blocks):
+        parts.append(filler)
+        parts.append('<script type="application/ld+json">{}</script>'.format(json.dumps(other, indent=1)))
+    parts.append(filler)
+    parts.append('<script type="application/ld+json">{}</script>'.format(json.dumps(recipe, indent=1)))
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def synthetic_recipe(keys=300, sections=30):
+    """
+    Builds a large recipe JSON object: many keys that are not used, instructions split into sections
+    :param keys: number of unused keys; int
+    :param sections: number of HowToSection, 10 steps each; int
+    :return: the recipe JSON object
+    """
+    recipe = {"@type": "Recipe", "name": "Synthetic Stew", "headline": "Synthetic Stew Headline",
+              "description": "A long stew", "prepTime": "PT30M", "cookTime": "PT2H30M", "totalTime": "PT3H",
+              "recipeYield": ["8", "8 servings"], "recipeIngredient": ["{} g beef".format(i) for i in range(40)],
+              "recipeInstructions": [{"@type": "HowToSection", "name": "Part {}".format(s), "itemListElement": [
+                  {"@type": "HowToStep", "text": "Step {} of part {}".format(i, s)} for i in range(10)]}
+                  for s in range(sections)]}
+    for i in range(keys):
+        recipe["extraProperty{}".format(i)] = {"@type": "PropertyValue", "value": i}
+    return recipe
+
+
+def synthetic_search_page(galleries=500, results=20, comments=2000):
+    """
+    Builds a large All Recipes search page: many gallery cards before the recipe results, long comment section
+    :param galleries: number of gallery cards before the first recipe; int
+    :param results: number of recipe cards; int
+    :param comments: number of comments after the results; int
+    :return: the HTML code; str
+    """
+    card = ('<a class="comp card--image-top mntl-card-list-items mntl-document-card" data-doc-id="{0}" data-tax-levels '
+            'href="https://www.allrecipes.com/{1}/{0}/synthetic-{0}/" data-ordinal="{0}">'
+            '<span class="card__title-text">Synthetic {1} {0}</span></a>\n')
+    parts = ["<html><head><title>Search</title></head><body><div id=\"search-results\">\n"]
+    parts += [card.format(i, "gallery") for i in range(galleries)]
+    parts += [card.format(galleries + i, "recipe") for i in range(results)]
+    parts.append("</div>\n")
+    comment = '<div class="comment"><p>Comment {}: made this last night!</p></div>\n'
+    parts += [comment.format(i) for i in range(comments)]
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def synthetic_library(recipes=100_000):
+    """
+    Builds many small standardized recipe dictionaries sharing a vocabulary of ingredients
+    :param recipes: number of recipes; int
+    :return: list of (standardized recipe dictionary, file name, web link, saved time)
+    """
+    foods = ["pasta", "eggs", "guanciale", "pecorino", "black pepper", "salt", "olive oil", "garlic", "onion",
+             "butter", "flour", "milk", "chicken", "rice", "tomatoes", "basil", "parmesan", "cream", "lemon", "sugar"]
+    units = ["1 cup", "2 tbsp", "100 g", "1 tsp", "3", "1/2 cup"]
+    entries = []
+    for i in range(recipes):
+        name = "Synthetic dish {}".format(i)
+        recipe = {"name": name, "articleBody": "A synthetic recipe number {}".format(i),
+                  "cookTime": "{} mins".format(10 + i % 50), "totalTime": "{} mins".format(20 + i % 70),
+                  "recipeYield": "{} servings".format(1 + i % 8),
+                  "recipeIngredients": ["{} {}".format(units[(i + k) % len(units)], foods[(i * 7 + k * 3) % len(foods)])
+                                        for k in range(5 + i % 10)],
+                  "recipeInstructions": ["Step {}: cook it".format(k) for k in range(1 + i % 8)]}
+        entries.append((recipe, name, "https://example.com/{}".format(i), 1.7e9 + i))
+    return entries
+
+
+# BENCHMARKS
+def time_call(func, *args, number=5):
+    """
+    Times a function call
+    :param func: the function to time
+    :param args: arguments for the function
+    :param number: number of calls per measurement; int
+    :return: best time per call in seconds; float
+    """
+    return min(repeat(lambda: func(*args), number=number, repeat=3)) / number
+
+
+def bench_get_recipe(pages):
+    """
+    Compares the previous get_recipe lookup with the JSON-LD extractor on each page
+    :param pages: list of (label, HTML code)
+    :return: None
+    """
+    from generate_html import get_recipe
+    print("get_recipe:")
+    for label, html in pages:
+        new = time_call(get_recipe, html)
+        try:
+            old = time_call(legacy_find, html)
+            old_text = "{:.2f} ms".format(old * 1000)
+            speedup = "{:.1f}x".format(old / new)
+        except (RecursionError, ValueError, IndexError) as e:  # previous implementation could not handle the page
+            old_text = "failed ({})".format(type(e).__name__)
+            speedup = "-"
+        print("  {}: {:.0f} KB, previous {}, new {:.2f} ms, speedup {}".format(
+            label, len(html) / 1000, old_text, new * 1000, speedup))
+
+
+def bench_matching():
+    """
+    Compares the previous Levenshtein function with matching.py when ranking many titles against one dish name
+    :return: None
+    """
+    import matching
+    query = "Chicken Tikka Masala"
+    words = ["Creamy", "Easy", "Chicken", "Tikka", "Masala", "Butter", "Curry", "Slow Cooker", "Vegan", "Paneer"]
+    titles = [" ".join(words[(i * k) % len(words)] for k in range(1, 2 + i % 5)) for i in range(500)]
+    old = time_call(lambda: [legacy_levenshtein(query, title) for title in titles], number=3)
+    new = time_call(matching.rank, query, titles, number=3)
+    bounded = time_call(matching.rank, query, titles, 5, number=3)
+    print("matching ({} titles):".format(len(titles)))
+    print("  previous {:.2f} ms, rank {:.2f} ms ({:.1f}x), rank with max_distance=5 {:.2f} ms ({:.1f}x)".format(
+        old * 1000, new * 1000, old / new, bounded * 1000, old / bounded))
+
+
+def bench_search_parsers():
+    """
+    Compares the previous All Recipes search page parser (first link) with the one-pass parser (first results)
+    :return: None
+    """
+    import recipe_finder
+    for galleries in (20, 500):
+        html = synthetic_search_page(galleries)
+        assert recipe_finder.parse_allrecipes_results(html)[0][0] == legacy_parse_allrecipes_results(html)
+        old = time_call(legacy_parse_allrecipes_results, html, number=5)
+        new = time_call(recipe_finder.parse_allrecipes_results, html, number=5)
+        print("search page ({} KB, {} galleries first):".format(len(html) // 1024, galleries))
+        print("  previous {:.2f} ms (1 link), new {:.2f} ms ({} links), speedup {:.1f}x".format(
+            old * 1000, new * 1000, recipe_finder.RESULTS, old / new))
+
+
+def bench_recipe_store():
+    """
+    Exports a large synthetic library to the binary store and scans it, compared with parsing the .json files the
+    library keeps next to every recipe
+    :return: None
+    """
+    from collections import Counter
+    from tempfile import TemporaryDirectory
+    from time import perf_counter
+    from recipe_store import export_recipes, RecipeStore
+    entries = synthetic_library()
+    documents = [json.dumps({"url": url, "saved": saved, "recipe": recipe}) for recipe, file, url, saved in entries]
+    with TemporaryDirectory() as directory:
+        store_path = path.join(directory, "library.rcp")
+        start = perf_counter()
+        export_recipes(entries, store_path)
+        exported = perf_counter() - start
+
+        def json_counts():
+            return Counter(item for document in documents
+                           for item in json.loads(document)["recipe"]["recipeIngredients"])
+
+        def store_counts():
+            with RecipeStore(store_path) as store:
+                return store.counts()
+
+        def store_recipes():
+            with RecipeStore(store_path) as store:
+                return sum(1 for _ in store)
+
+        assert store_counts() == json_counts()
+        old = time_call(json_counts, number=1)
+        new = time_call(store_counts, number=1)
+        full = time_call(store_recipes, number=1)
+        print("recipe store ({} recipes, {} KB, JSON {} KB):".format(len(entries), path.getsize(store_path) // 1024,
+                                                                   sum(len(d) for d in documents) // 1024))
+        print("  export {:.2f}s, ingredient counts: JSON {:.2f}s, store {:.3f}s ({:.0f}x), "
+              "all recipes from the store {:.2f}s".format(exported, old, new, old / new, full))
+
+
+def bench_clean_recipe():
+    """
+    Compares the previous clean_recipe with the table-driven one on a large recipe object
+    :return: None
+    """
+    from generate_html import clean_recipe
+    recipe = synthetic_recipe()
+    old = time_call(legacy_clean_recipe, recipe, number=20)
+    new = time_call(clean_recipe, recipe, number=20)
+    print("clean_recipe ({} keys, {} sections):".format(len(recipe), len(recipe["recipeInstructions"])))
+    print("  previous {:.3f} ms, new {:.3f} ms, speedup {:.1f}x".format(old * 1000, new * 1000, old / new))
+
+
+def import_times(args):
+    """
+    Runs recipe.py with -X importtime in an empty directory
+    :param args: arguments for recipe.py; list of str
+    :return: two-tuple (seconds spent importing, excluding the interpreter start-up; float, imported modules; set)
+    """
+    import subprocess
+    from tempfile import TemporaryDirectory
+    script = path.join(path.dirname(path.abspath(__file__)), "recipe.py")
+    with TemporaryDirectory() as directory:
+        process = subprocess.run([sys.executable, "-X", "importtime", script] + args, cwd=directory,
+                                 stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 text=True, check=True)
+    seconds = 0
+    modules = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():  # column titles
+            continue
+        if name.strip() == "site":  # everything before belongs to the interpreter start-up
+            seconds = 0
+            modules = set()
+            continue
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):  # top level import, its time includes the nested ones
+            seconds += int(cumulative) / 1e6
+    return seconds, modules
+
+
+def check_startup():
+    """
+    Checks that recipe.py starts quickly: STARTUP_COMMANDS must stay within STARTUP_BUDGET (best of 3 runs) and
+    must not import HEAVY_MODULES
+    :return: list of failure messages
+    """
+    failures = []
+    print("startup (imports):")
+    for args in STARTUP_COMMANDS:
+        runs = [import_times(args) for _ in range(3)]
+        seconds = min(run[0] for run in runs)
+        label = "recipe.py " + " ".join(args) if args else "recipe.py (usage)"
+        print("  {}: {:.1f} ms".format(label, seconds * 1000))
+        if seconds > STARTUP_BUDGET:
+            failures.append("startup {}: {:.1f} ms, budget {:.1f} ms".format(label, seconds * 1000,
+                                                                           STARTUP_BUDGET * 1000))
+        heavy = sorted(set(HEAVY_MODULES).intersection(runs[0][1]))
+        if heavy:
+            failures.append("startup {}: imports {}".format(label, ", ".join(heavy)))
+    return failures
+
+
+# REGRESSION SUITE (offline, fixtures served by fixture_server.py)
+def fixture_pages():
+    """
+    Get the recipe page fixtures
+    :return: dictionary original web link -> HTML code
+    """
+    with open(path.join(FIXTURES_PATH, "routes.json"), encoding="utf-8") as f:
+        routes = json.load(f)
+    pages = {}
+    for url, page in routes.items():
+        if page.endswith("_recipe.html"):
+            with open(path.join(FIXTURES_PATH, "pages", page), encoding="utf-8") as f:
+                pages[url] = f.read()
+    return pages
+
+
+def run_pipeline(urls):
+    """
+    Runs url_to_recipe on every fixture link and name_to_recipe on every dish, against the local stand-in
+    :param urls: web links of the recipe fixtures; list of str
+    :return: dictionary with the results, same layout as fixtures/golden.json
+    """
+    from generate_html import url_to_recipe, name_to_recipe
+    results = {"urls": {}, "dishes": {}}
+    with redirect_stdout(StringIO()):  # name_to_recipe reports every website
+        for url in urls:
+            val = url_to_recipe(url)
+            results["urls"][url] = val if type(val) is not tuple else {"name": val[0], "recipe": val[1],
+                                                                         "url": val[2]}
+        for dish in DISHES:
+            val = name_to_recipe(dish, exact_distance=-1)  # wait for every website: same result whatever answers first
+            results["dishes"][dish] = val if type(val) is not tuple else {"name": val[0], "url": val[2]}
+    return results
+
+
+def check_golden(results, update=False):
+    """
+    Compares pipeline results with fixtures/golden.json
+    :param results: results of run_pipeline
+    :param update: overwrite the golden file with these results instead; bool
+    :return: list of failure messages
+    """
+    if update:
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1, ensure_ascii=False, sort_keys=True)
+        print("golden results updated")
+        return []
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        golden = json.load(f)
+    failures = []
+    for group in ("urls", "dishes"):
+        for key, expected in golden[group].items():
+            if results[group].get(key) != expected:
+                failures.append("{} {}: expected {}, got {}".format(group[:-1], key, json.dumps(expected)[:200],
+                                                                    json.dumps(results[group].get(key))[:200]))
+    return failures
+
+
+def time_stages(pages):
+    """
+    Times every pipeline stage on the fixtures (and a large synthetic page for get_recipe)
+    :param pages: dictionary original web link -> HTML code
+    :return: dictionary stage -> calls per second
+    """
+    from generate_html import get_html, get_recipe, clean_recipe, name_to_recipe
+    from render_html import create_minimized_html
+    import recipe_finder
+    htmls = list(pages.values())
+    recipes = [get_recipe(html) for html in htmls]
+    cleaned = [clean_recipe(recipe) for recipe in recipes]
+    large = synthetic_page()
+    finders = [finder.link for finder in recipe_finder.FINDERS.values()]
+
+    stages = {"get_recipe": (lambda: [get_recipe(html) for html in htmls], len(htmls), 20),
+              "get_recipe (3 MB page)": (lambda: get_recipe(large), 1, 3),
+              "clean_recipe": (lambda: [clean_recipe(recipe) for recipe in recipes], len(recipes), 50),
+              "create_minimized_html": (lambda: [create_minimized_html(c) for c in cleaned], len(cleaned), 50),
+              "get_html (local)": (lambda: [get_html(url) for url in pages], len(pages), 5),
+              "finders (local)": (lambda: [f(dish) for f in finders for dish in DISHES], len(finders) * len(DISHES),
+                                  5),
+              "name_to_recipe (local)": (lambda: [name_to_recipe(dish) for dish in DISHES], len(DISHES), 3)}
+    throughput = {}
+    with redirect_stdout(StringIO()):
+        for stage, (func, calls, number) in stages.items():
+            throughput[stage] = calls / time_call(func, number=number)
+    return throughput
+
+
+def check_baseline(throughput, save=False):
+    """
+    Compares stage throughput with fixtures/baseline.json
+    :param throughput: dictionary stage -> calls per second
+    :param save: save these numbers as the new baseline instead; bool
+    :return: list of failure messages
+    """
+    if save:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(throughput, f, indent=1)
+        print("baseline saved to {}".format(BASELINE_PATH))
+        return []
+    try:
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except OSError:
+        print("no baseline on this machine, run with --save-baseline to record one")
+        return []
+    return ["{}: {:.1f}/s, baseline {:.1f}/s".format(stage, throughput[stage], baseline[stage])
+            for stage in throughput if stage in baseline and throughput[stage] < baseline[stage] * (1 - TOLERANCE)]
+
+
+def run_suite(update_golden=False, save_baseline=False):
+    """
+    Offline regression suite: golden results and stage throughput against the local stand-in of the websites,
+    start-up time of recipe.py
+    :param update_golden: overwrite fixtures/golden.json; bool
+    :param save_baseline: overwrite fixtures/baseline.json; bool
+    :return: list of failure messages
+    """
+    import http_cache
+    import render_detection
+    import recipe_finder
+    import scheduler
+    from fixture_server import FixtureServer
+    http_cache.enabled = False  # always go to the stand-in, never read or write the cache
+    render_detection.use_decisions({})  # ignore decisions learned from the real websites
+    recipe_finder.use_stats({})  # search the websites in registration order, no circuit breaker open
+    scheduler.use_robots({})  # download the robots.txt of the stand-in, never the saved ones
+
+    pages = fixture_pages()
+    with FixtureServer():
+        failures = check_golden(run_pipeline(list(pages)), update_golden)
+        scheduler.enabled = False  # measure the pipeline, not the rate limits
+        try:
+            throughput = time_stages(pages)
+        finally:
+            scheduler.enabled = True
+    print("stages:")
+    for stage, value in throughput.items():
+        print("  {}: {:.1f}/s".format(stage, value))
+    return failures + check_baseline(throughput, save_baseline) + check_startup()
+
+
+# MAIN
+def main(args):
+    """
+    Runs the regression suite and the benchmarks, should take arguments from console (excluding path argument 0)
+    :param args: options (--update-golden, --save-baseline) and saved HTML pages to benchmark in addition to the
+                 synthetic pages
+    :return: exit code, 1 if the suite failed; int
+    """
+    failures = run_suite("--update-golden" in args, "--save-baseline" in args)
+
+    pages = [("synthetic (40 blocks)", synthetic_page()), ("synthetic (400 blocks)", synthetic_page(blocks=400))]
+    for file_name in args:
+        if not file_name.startswith("--"):
+            with open(file_name, encoding="utf-8", errors="replace") as f:
+                pages.append((file_name, f.read()))
+    bench_get_recipe(pages)
+    bench_matching()
+    bench_search_parsers()
+    bench_clean_recipe()
+    bench_recipe_store()
+
+    for failure in failures:
+        print("FAILED " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
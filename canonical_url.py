@@ -0,0 +1,84 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, urljoin, parse_qsl, urlencode
+
+# query parameters that only track where a visitor came from, they never change the recipe
+TRACKING_PARAMETERS = {"fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid", "igshid", "_ga", "ref",
+                       "ref_src", "smid", "smtyp", "cmpid", "campaign_id", "ito", "soc_src", "soc_trk", "taid"}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_")
+CANONICAL_LINK_PATTERN = re.compile(r'<link\b[^>]*\brel\s*=\s*["\']?canonical["\']?[^>]*>', re.IGNORECASE)
+HREF_PATTERN = re.compile(r'\bhref\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def is_tracking_parameter(name):
+    """
+    Checks if a query parameter is only used for tracking
+    :param name: the parameter name; str
+    :return: bool
+    """
+    name = name.lower()
+    return name in TRACKING_PARAMETERS or name.startswith(TRACKING_PREFIXES)
+
+
+def unwrap_google_url(url):
+    """
+    Get the original link of a Google redirect URL (google.com/url?q=... or ?url=...)
+    :param url: the web link; str
+    :return: the original link, or url unchanged if it is not a Google redirect; str
+    """
+    parts = urlsplit(url)
+    if "google." in parts.netloc and parts.path == "/url":
+        query = dict(parse_qsl(parts.query))
+        return query.get("url") or query.get("q") or url
+    return url
+
+
+def canonicalize(url):
+    """
+    Normalizes a web link so that different links to the same page compare equal: Google redirects unwrapped,
+    scheme and domain lowercased, default port, fragment and tracking parameters removed, remaining query sorted,
+    trailing slash removed
+    :param url: the web link; str
+    :return: the canonical link; str
+    """
+    parts = urlsplit(unwrap_google_url(url.strip()))
+    scheme = parts.scheme.lower() or "https"
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = "{}:{}".format(host, parts.port)
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not is_tracking_parameter(k)))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def canonical_href(html, url):
+    """
+    Get the <link rel="canonical"> of a page as the website gives it (a link that can be downloaded again, unlike the
+    comparison key of canonicalize() which drops the trailing slash)
+    :param html: the HTML code; str
+    :param url: the web link of the page (for relative canonical links); str
+    :return: the absolute canonical link of the page; str, None if the page has none
+    """
+    for tag in CANONICAL_LINK_PATTERN.finditer(html):
+        href = HREF_PATTERN.search(tag.group(0))
+        if href:
+            return urljoin(url, href.group(1).replace("&amp;", "&"))
+    return None
+
+
+def resolve_redirects(url, timeout=10):
+    """
+    Follows redirects of a web link without downloading the page (HEAD request)
+    :param url: the web link; str
+    :param timeout: seconds to wait for the server; float
+    :return: the canonical final link, or the canonical url if the server could not be asked; str
+    """
+    import requests  # network modules are only loaded when a link has to be resolved
+    import http_client
+    try:
+        r = http_client.head(url, allow_redirects=True, timeout=timeout)
+    except requests.exceptions.RequestException:
+        return canonicalize(url)
+    if r.status_code >= 400:  # some servers do not allow HEAD
+        return canonicalize(url)
+    return canonicalize(r.url)
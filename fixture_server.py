@@ -0,0 +1,121 @@
+import json
+from os import path
+from hashlib import sha1
+from threading import Thread
+from time import monotonic, sleep
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, unquote
+import http_client
+
+FIXTURES_PATH = path.join(path.dirname(path.abspath(__file__)), "fixtures")
+ROUTES_PATH = path.join(FIXTURES_PATH, "routes.json")  # {original web link: file in fixtures/pages}
+PAGES_PATH = path.join(FIXTURES_PATH, "pages")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    Serves fixtures/pages for requests of the form /<scheme>/<host>/<path>?<query>, with ETag revalidation
+    """
+    def do_GET(self):
+        scheme, _, rest = self.path.lstrip("/").partition("/")
+        url = unquote("{}://{}".format(scheme, rest))
+        start = monotonic()
+        try:
+            self._serve(url)
+        finally:
+            self.server.log.append((url, start, monotonic()))
+
+    def _serve(self, url):
+        """
+        Answers a request
+        :param url: the original web link; str
+        :return: None
+        """
+        busy = self.server.busy.get(url)
+        if busy:  # server busy: 503 with the next Retry-After value, no header for None
+            retry_after = busy.pop(0)
+            self.send_response(503)
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        page = self.server.routes.get(url)
+        if page is None and "?" not in url:  # like the websites, pages are served with or without a trailing slash
+            page = self.server.routes.get(url[:-1] if url.endswith("/") else url + "/")
+        if page is None:
+            self.send_error(404)
+            return
+        with open(path.join(self.server.pages_path, page), "rb") as f:
+            body = f.read()
+        sleep(self.server.delay)
+        etag = '"{}"'.format(sha1(body).hexdigest())
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):  # keep benchmark output readable
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 128  # many concurrent connections (async_api.py), the default backlog of 5 stalls them
+
+
+class FixtureServer:
+    """
+    Local stand-in for the recipe websites: while installed, every http_client request is sent to this server
+    """
+    def __init__(self, routes_path=ROUTES_PATH, routes=None, pages_path=PAGES_PATH, delay=0, busy=None):
+        """
+        :param routes_path: JSON file mapping original web links to fixture pages; str
+        :param routes: (optional) mapping used instead of the file, e.g. with some pages removed; dict
+        :param pages_path: (optional) directory of the pages; str
+        :param delay: (optional) seconds taken to answer each page, e.g. to keep requests running at the same time;
+                      float
+        :param busy: (optional) {web link: Retry-After values} answered with 503 before the page, one per request
+                     (None for no header); dict
+        """
+        if routes is None:
+            with open(routes_path, encoding="utf-8") as f:
+                routes = json.load(f)
+        self._server = _Server(("127.0.0.1", 0), FixtureHandler)
+        self._server.routes = routes
+        self._server.pages_path = pages_path
+        self._server.delay = delay
+        self._server.busy = {url: list(values) for url, values in (busy or {}).items()}
+        self._server.log = self.log = []  # (web link, monotonic start, monotonic end) of every request served
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+    def rewrite(self, url):
+        """
+        Get the local address serving a web link
+        :param url: the original web link; str
+        :return: the local web link; str
+        """
+        parts = urlsplit(url)
+        local = "http://127.0.0.1:{}/{}/{}{}".format(self.port, parts.scheme, parts.netloc, parts.path)
+        return local + "?" + parts.query if parts.query else local
+
+    def __enter__(self):
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        http_client.url_rewriter = self.rewrite
+        return self
+
+    def __exit__(self, *args):
+        http_client.url_rewriter = None
+        self._server.shutdown()
+        self._server.server_close()
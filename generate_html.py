@@ -1,276 +1,580 @@
 import requests
-import json
-from os import path
+import re
+from queue import Queue, Empty
+from threading import Thread, Event, Lock
+from time import monotonic
 import recipe_finder
-
-
-def get_html(url, min_length=50000):
+import matching
+import json_ld
+import http_cache
+import http_client
+import render_detection
+import canonical_url
+from instrumentation import stage, count
+from render_html import create_minimized_html
+
+# schema.org key (lowercase) -> (field of the standardized dictionary, priority), the smallest priority wins
+FIELD_KEYS = {"name": ("name", 0), "headline": ("name", 1), "title": ("name", 2),
+              "description": ("articleBody", 0), "articlebody": ("articleBody", 1),
+              "totaltime": ("totalTime", 0),
+              "cooktime": ("cookTime", 0), "preptime": ("cookTime", 1),
+              "recipeyield": ("recipeYield", 0), "yield": ("recipeYield", 1),
+              "recipeingredient": ("recipeIngredients", 0), "recipeingredients": ("recipeIngredients", 1),
+              "ingredients": ("recipeIngredients", 2),
+              "recipeinstructions": ("recipeInstructions", 0), "instructions": ("recipeInstructions", 1)}
+SINGLE_FIELDS = ("name", "articleBody", "cookTime", "totalTime", "recipeYield")  # fields holding one text
+DURATION_FIELDS = {"cookTime", "totalTime"}  # fields holding an ISO-8601 duration
+TEXT_KEYS = ("text", "name", "@value", "value", "url")  # keys holding the text of a schema.org object, in order
+
+DURATION_PATTERN = re.compile(r"P(?:(?P<years>\d+(?:[.,]\d+)?)Y)?(?:(?P<months>\d+(?:[.,]\d+)?)M)?"
+                              r"(?:(?P<weeks>\d+(?:[.,]\d+)?)W)?(?:(?P<days>\d+(?:[.,]\d+)?)D)?"
+                              r"(?:T(?:(?P<hours>\d+(?:[.,]\d+)?)H)?(?:(?P<minutes>\d+(?:[.,]\d+)?)M)?"
+                              r"(?:(?P<seconds>\d+(?:[.,]\d+)?)S)?)?$", re.IGNORECASE)
+DURATION_SECONDS = (("weeks", 604800), ("days", 86400), ("hours", 3600), ("minutes", 60), ("seconds", 1))
+DURATION_UNITS = (("day", "days", 86400), ("hr", "hrs", 3600), ("min", "mins", 60), ("sec", "secs", 1))
+
+
+def get_html(url):
     """
-    Get HTML from any web link
+    Get HTML from any web link, the browser is only used when the page has no recipe data without JS
+    (see render_detection.py)
     :param url: the web link; str
-    :param min_length: minimum accepted HTML length for using raw request; int
     :return: the HTML markdown; str
     """
-    r = requests.get(url, headers={
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:110.0) Gecko/20100101 Firefox/110.0'})
-
-    if len(r.text) < min_length:  # HTML is less than min_length, is probably dynamically loaded by JS
-        from get_html_selenium import get_html_selenium
-        return get_html_selenium(url)
-
-    return r.text
+    decision = render_detection.needs_browser(url)
+    if decision:  # domain is known to need JS, skip the static download
+        render_detection.count("browser_direct")
+    else:
+        with stage("download", url):  # stops downloading once the recipe block has arrived
+            text = http_cache.get(url, until=json_ld.RecipeScanner().feed)
+        if render_detection.has_recipe_data(text):  # static page is enough
+            render_detection.count("static_hits")
+            render_detection.record(url, False)
+            return text
+        render_detection.count("static_misses")
+        if decision is False and not render_detection.recheck(url):
+            return text  # domain serves recipes statically, this page simply has none
+
+    return render_in_browser(url)
+
+
+def render_in_browser(url):
+    """
+    Get HTML of a web link after running its JS in the browser
+    :param url: the web link; str
+    :return: the HTML markdown; str
+    """
+    from get_html_selenium import get_html_selenium
+    render_detection.count("browser_runs")
+    with stage("browser fallback", url):
+        html = get_html_selenium(url)
+    if render_detection.has_recipe_data(html):  # recipe only appears after rendering
+        render_detection.record(url, True)
+    return html
 
 
-def get_recipe(html, lookfor='"@type"'):
+def get_recipe(html):
     """
-    Get JSON formatted recipe
+    Get JSON formatted recipe, searches the JSON-LD blocks in a single pass (see json_ld.py)
     :param html: the HTML code to parse
-    :param lookfor: (optional) where to start searching for the JSON object
-    :return: recipe JSON object
-    """
-    # find JSON object {} by starting at the "lookfor"
-    j = html.find(lookfor)
-    if j == -1:
-        return
-
-    # get first '{' by searching backwards
-    counter = 1
-    while counter > 0:
-        j -= 1
-        if html[j] == "}":
-            counter += 1
-        elif html[j] == "{":
-            counter -= 1
-    start = j
-
-    # get string from first '{' to last '}'
-    counter = 1
-    while counter > 0:
-        j += 1
-        if html[j] == "{":
-            counter += 1
-        elif html[j] == "}":
-            counter -= 1
-
-    # create JSON object
-    json_recipe = json.loads(html[start:j + 1])
-    try:
-        typ = json_recipe["@type"]
-    except KeyError:
-        if lookfor == '"@type":"Recipe"':  # second attempt, give up
-            return
-        else:
-            return get_recipe(html, lookfor='"@type":"Recipe"')  # try again with different lookfor
+    :return: recipe JSON object, None if no recipe found
+    """
+    return json_ld.find_recipe(html)
+
 
-    if "Recipe" not in typ:  # recursive try, try with next segment of HTML
-        return get_recipe(html[j + 1:])
-    else:  # successful try
-        return json_recipe
+def normalize_duration(value):
+    """
+    Converts an ISO-8601 duration into readable text (e.g. "PT1H30M" -> "1 hr 30 mins", "PT90M" -> "1 hr 30 mins")
+    :param value: the duration; str
+    :return: the readable duration, value unchanged if it is not an ISO-8601 duration (or has years/months); str
+    """
+    match = DURATION_PATTERN.match(value.strip())
+    if match is None or not any(match.groups()) or match.group("years") or match.group("months"):
+        return value
+    seconds = 0.0
+    for unit, factor in DURATION_SECONDS:
+        if match.group(unit):
+            seconds += float(match.group(unit).replace(",", ".")) * factor
+    seconds = int(round(seconds))
+
+    parts = []
+    for singular, plural, factor in DURATION_UNITS:
+        amount, seconds = divmod(seconds, factor)
+        if amount:
+            parts.append("{} {}".format(amount, singular if amount == 1 else plural))
+    return " ".join(parts) if parts else "0 mins"
+
+
+def field_text(value):
+    """
+    Get the text of a single valued recipe field (first element of lists, text of schema.org objects)
+    :param value: the JSON value
+    :return: the text, None if the value has no usable text; str
+    """
+    while type(value) is list:
+        if not value:
+            return None
+        value = value[0]
+    if type(value) is dict:
+        value = next((value[k] for k in TEXT_KEYS if value.get(k) not in (None, "", [], {})), None)
+        return None if value is None or type(value) in (list, dict) else str(value).strip()
+    if value is None or type(value) is bool:
+        return None
+    return str(value).strip()
+
+
+def flatten_steps(value):
+    """
+    Flattens recipeInstructions or recipeIngredient (text, HowToStep, HowToSection, ItemList, nested lists) into a
+    list of individual steps in document order, iteratively so that deep trees cannot exceed the recursion limit
+    :param value: the JSON value
+    :return: the steps; list of str
+    """
+    steps = []
+    append = steps.append
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if type(item) is list:
+            stack.extend(reversed(item))
+        elif type(item) is dict:
+            text = item.get("text")
+            if type(text) is str:  # common case, HowToStep with its text
+                text = text.strip()
+                if text:
+                    append(text)
+            elif "itemListElement" in item:  # HowToSection / ItemList, the section name is not a step
+                stack.append(item["itemListElement"])
+            else:  # HowToDirection, HowToTip, step without text...
+                text = field_text(item)
+                if text:
+                    append(text)
+        elif type(item) is str:
+            if "\n" not in item:
+                item = item.strip()
+                if item:
+                    append(item)
+            else:  # one step per line
+                steps.extend(line.strip() for line in item.splitlines() if line.strip())
+        elif item is not None and type(item) is not bool:
+            steps.append(str(item))
+    return steps
 
 
 def clean_recipe(recipe_json):
     """
-    Takes recipe JSON object and returns standardized "cleaned" dictionary
+    Takes recipe JSON object and returns standardized "cleaned" dictionary, each JSON key is looked up in FIELD_KEYS
+    and, when several keys fill the same field, the one with the best priority wins
     :param recipe_json: the recipe JSON object
     :return: a standardized dictionary with exactly the following keys: name, articleBody, totalTime, cookTime,
                                                             recipeYield, recipeIngredients, recipeInstructions
+             None if the recipe has no ingredients or no instructions
     """
-    cleaned = {}
-    # Dictionary below defines keywords. Structure is keyword (lowercase):refword (refwords MUST be one of below)
-    # refwords: name, articleBody, totalTime, cookTime, recipeYield, recipeIngredients, recipeInstructions
-    key = {"totaltime": "totalTime", "cooktime": "cookTime", "preptime": "cookTime", "name": "name", "title": "name",
-           "article": "articleBody", "body": "articleBody", "description": "articleBody", "yield": "recipeYield",
-           "ingredient": "recipeIngredients", "instruction": "recipeInstructions"}
-
-    # Go through all keywords and add to "cleaned" dictionary
-    keyword_list = list(key.keys())  # list of all keywords
-    for recipeKey in recipe_json:
-        for keyword in keyword_list:
-            if keyword in recipeKey.lower():  # a keyword matches this JSON entry
-                if (key[keyword] == "recipeIngredients") or (key[keyword] == "recipeInstructions"):
-                    cleaned[key[keyword]] = recipe_json[recipeKey]  # set to original JSON entry
-
-                elif type(recipe_json[recipeKey]) is list:
-                    cleaned[key[keyword]] = recipe_json[recipeKey][0]  # set to first in list only
-
-                elif type(recipe_json[recipeKey]) is dict:  # handle dictionary case (only if key is "text" or "url")
-                    if "text" in recipe_json[recipeKey]:
-                        cleaned[key[keyword]] = recipe_json[recipeKey]["text"]
-                    elif "url" in recipe_json[recipeKey]:
-                        cleaned[key[keyword]] = recipe_json[recipeKey]["url"]
-                    else:  # unknown key, give up
-                        return
-
-                else:
-                    cleaned[key[keyword]] = recipe_json[recipeKey]  # set to original JSON entry
-
-                continue
-
-    # Handling strange "recipeInstructions" formatting
-    if type(cleaned['recipeInstructions'][0]) is dict:
-        cleaned_instructions = []
-        for i in cleaned['recipeInstructions']:
-            try:
-                cleaned_instructions.append(i['text'])
-            except KeyError:
-                try:
-                    t = i["itemListElement"]
-                    te = ""
-                    for t1 in t:
-                        te = te + t1['text'] + "<br><br>"
-                    cleaned_instructions.append(te)
-                except KeyError:
-                    cleaned_instructions.append(i)
-        cleaned['recipeInstructions'] = cleaned_instructions
-    elif type(cleaned['recipeInstructions'][0]) is str:
-        cleaned['recipeInstructions'] = [cleaned['recipeInstructions']]
-    elif not (type(cleaned['recipeInstructions']) is list):
-        return
-
-    # Handling 2D list for instructions (transform [[x, y, z]] -> [x, y, z])
-    if type(cleaned["recipeInstructions"]) is list:
-        if len(cleaned["recipeInstructions"]) == 1 and type(cleaned["recipeInstructions"][0]) is list:
-            cleaned["recipeInstructions"] = cleaned["recipeInstructions"][0]
+    if type(recipe_json) is not dict:
+        return None
+
+    found = {}  # field -> (priority, JSON value)
+    for recipe_key, value in recipe_json.items():
+        target = FIELD_KEYS.get(recipe_key.lower())
+        if target is None or value in (None, "", [], {}):
+            continue
+        field, priority = target
+        if field not in found or priority < found[field][0]:
+            found[field] = (priority, value)
 
     # Ensures instructions and ingredients are present (the two critical components to a recipe)
-    if not ("recipeInstructions" in cleaned and "recipeIngredients" in cleaned):
-        return
+    if "recipeInstructions" not in found or "recipeIngredients" not in found:
+        return None
+    cleaned = {"recipeIngredients": flatten_steps(found["recipeIngredients"][1]),
+               "recipeInstructions": flatten_steps(found["recipeInstructions"][1])}
 
-    # Further handling of other keys
-    keys = ["name", "articleBody", "cookTime", "totalTime", "recipeYield"]
-    for i in keys:
-        if (not (i in cleaned)) or (cleaned[i] is None):
-            cleaned[i] = ''  # if they do not exist, set it to empty string
-        if (i == "cookTime" or i == "totalTime") and cleaned[i][:2] == "PT":
-            cleaned[i] = cleaned[i][2:]  # remove "PT" in any times
+    for field in SINGLE_FIELDS:
+        text = field_text(found[field][1]) if field in found else None
+        if text and field in DURATION_FIELDS:
+            text = normalize_duration(text)
+        cleaned[field] = text or ''  # if they do not exist, set it to empty string
 
     return cleaned
 
 
-def create_minimized_html(cleaned_recipe):
+def file_name(cleaned_recipe):
     """
-    Takes standardized dictionary and returns HTML, requires HTML file template in "recipe/single-recipe-template.html"
+    Get the file name of a recipe from its standardized dictionary
     :param cleaned_recipe: the standardized recipe dictionary
-    :return: the final HTML markdown; list
-    """
-    # Get template lines
-    working_path = path.dirname(path.abspath(__file__))
-    template_path = path.join(working_path, "recipe", "single-recipe-template.html")
-    with open(template_path) as f:
-        lines = f.readlines()
-    final_lines = []
-
-    # Replace placeholders with values in cleaned recipe
-    for line in lines:
-        if "(name)" in line:  # name
-            final_lines.append(line.replace("(name)", str(cleaned_recipe["name"])))
-        elif "(articleBody)" in line:  # body
-            final_lines.append(line.replace("(articleBody)", str(cleaned_recipe["articleBody"])))
-        elif "(cookTime)" in line:  # cook time
-            final_lines.append(line.replace("(cookTime)", str(cleaned_recipe["cookTime"])))
-        elif "(totalTime)" in line:  # total time
-            final_lines.append(line.replace("(totalTime)", str(cleaned_recipe["totalTime"])))
-        elif "(recipeYield)" in line:  # yield
-            final_lines.append(line.replace("(recipeYield)", str(cleaned_recipe["recipeYield"])))
-        elif "<!-- start instructions -->" in line:  # instructions (loop through list)
-            for i in range(len(cleaned_recipe["recipeInstructions"])):
-                final_lines.append('<div class="single-instruction"><header>')
-                final_lines.append('<p>step {}</p>'.format(i+1))
-                final_lines.append('<div></div></header><p>{}</p></div>'.format(cleaned_recipe["recipeInstructions"][i]))
-        elif "<!-- start ingredients -->" in line:  # ingredients (loop through list)
-            for i in cleaned_recipe["recipeIngredients"]:
-                final_lines.append('<p class="single-ingredient">{}</p>'.format(i))
-        else:  # non-placeholder line
-            final_lines.append(line)
-
-    return final_lines
+    :return: the name with prohibited characters replaced; str
+    """
+    # Get name from dictionary and ensure no prohibited characters
+    name = str(cleaned_recipe["name"])
+    name = name.replace("/", "_")
+    name = name.replace("\\", "_")
+    name = name.replace("*", "_")
+    name = name.replace(":", "_")
+    name = name.replace("?", "_")
+    name = name.replace('"', "_")
+    name = name.replace("<", "_")
+    name = name.replace(">", "_")
+    name = name.replace("|", "_")
 
+    return name
 
-def url_to_html(url):
+
+def url_to_recipe(url):
     """
-    Uses above functions to streamline process from URL -> final HTML
+    Uses above functions to streamline process from URL -> standardized dictionary
     :param url: The web link to the recipe
-    :return: A two-tuple (name, HTML) -- the name of the dish and the HTML markdown of the recipe
+    :return: A three-tuple (name, recipe, url) -- the file name of the dish, the standardized recipe dictionary and
+             the web link (<link rel="canonical"> of the page if it has one, otherwise url)
             Exceptions: 0 = could not find a recipe in the webpage, -1 = could not parse the recipe,
-                                                                            -2 = could not find dish name (invalid URL)
+                        -2 = could not find dish name (invalid URL), -3 = network error
     """
     try:
-        html = get_html(url)
+        with stage("get_html", url):
+            html = get_html(url)
     except (requests.exceptions.InvalidURL, requests.exceptions.ConnectionError, requests.exceptions.RequestException):
         return -3
-    recipe = get_recipe(html, lookfor='"@type":"Recipe"')  # Step 1: Get HTML code and extract JSON
+    return html_to_recipe(html, url)
 
-    if recipe is None:  # Step 1: try again with different lookfor
-        recipe = get_recipe(get_html(url))
+
+def html_to_recipe(html, url):
+    """
+    Steps of url_to_recipe after the download: HTML -> standardized dictionary
+    :param html: the HTML code of the recipe page; str
+    :param url: the web link of the page; str
+    :return: A three-tuple (name, recipe, url), see url_to_recipe
+            Exceptions: 0 = could not find a recipe in the webpage, -1 = could not parse the recipe
+    """
+    with stage("get_recipe", url):
+        recipe = get_recipe(html)  # Step 1: Get HTML code and extract JSON
     if recipe is None:  # Step 1: failed to find recipe, give up
         return 0
 
-    cleaned_recipe = clean_recipe(recipe)  # Step 2: clean recipe JSON into standardized dictionary
+    with stage("clean_recipe", url):
+        cleaned_recipe = clean_recipe(recipe)  # Step 2: clean recipe JSON into standardized dictionary
     if cleaned_recipe is None:  # Step 2: failed to parse recipe, give up
         return -1
 
-    minimized_html = create_minimized_html(cleaned_recipe)  # Step 3: convert standardized dictionary to HTML markdown
+    # a link the page can be downloaded from again (recipe.py --refresh), library.py compares them canonicalized
+    url = canonical_url.canonical_href(html, url) or url
+    return file_name(cleaned_recipe), cleaned_recipe, url
 
-    # Get name from dictionary and ensure no prohibited characters
 
-    name = str(cleaned_recipe["name"])
-    name = name.replace("/", "_")
-    name = name.replace("\\", "_")
-    name = name.replace("*", "_")
-    name = name.replace(":", "_")
-    name = name.replace("?", "_")
-    name = name.replace('"', "_")
-    name = name.replace("<", "_")
-    name = name.replace(">", "_")
-    name = name.replace("|", "_")
+def recheck_recipe(url, etag=None, last_modified=None):
+    """
+    Converts a saved recipe's web link again only if the page changed: conditional GET with the validators of the
+    version saved before (the cache of http_cache.py is bypassed, a fresh cached copy would hide changes)
+    :param url: the web link of the recipe; str
+    :param etag: (optional) ETag of the version saved before; str
+    :param last_modified: (optional) Last-Modified of the version saved before; str
+    :return: A two-tuple (val, validators) -- val is None if the page did not change, otherwise the three-tuple
+             (name, recipe, url) or the error code of url_to_recipe; validators is the two-tuple (ETag, Last-Modified)
+             of the page
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        with stage("download", url):  # stops downloading once the recipe block has arrived
+            r, html, complete = http_client.get_text(url, json_ld.RecipeScanner().feed, headers=headers)
+        validators = (r.headers.get("ETag") or etag, r.headers.get("Last-Modified") or last_modified)
+        if r.status_code == 304:  # not modified
+            return None, validators
+        if r.status_code != 200:  # page gone or server error, keep the saved version
+            return -3, (etag, last_modified)
+        if not render_detection.has_recipe_data(html) and (render_detection.needs_browser(url) is not False
+                                                             or render_detection.recheck(url)):
+            html = render_in_browser(url)
+    except requests.exceptions.RequestException:
+        return -3, (etag, last_modified)
+    return html_to_recipe(html, url), validators
+
 
-    return name, minimized_html
+def url_to_html(url):
+    """
+    Uses above functions to streamline process from URL -> final HTML
+    :param url: The web link to the recipe
+    :return: A two-tuple (name, HTML) -- the name of the dish and the HTML markdown of the recipe
+            Exceptions: 0 = could not find a recipe in the webpage, -1 = could not parse the recipe,
+                                                                            -2 = could not find dish name (invalid URL)
+    """
+    val = url_to_recipe(url)
+    if type(val) is not tuple:  # error code
+        return val
+    with stage("render"):
+        return val[0], create_minimized_html(val[1])  # Step 3: convert standardized dictionary to HTML markdown
 
 
-def name_to_html(name):
+class _TitleBoard:
+    """
+    Closest search result title over the websites of one search: a website downloads its recipe page only if its
+    title is within recipe_finder.TITLE_MARGIN of it
     """
-    Uses recipe_finder.py to get HTML from the name
+    def __init__(self, websites, wait):
+        """
+        :param websites: number of websites searched; int
+        :param wait: seconds to wait for the search results of the other websites; float
+        """
+        self._lock = Lock()
+        self._pending = websites
+        self._best = None
+        self._done = Event()
+        self._deadline = monotonic() + wait
+        self.skipped = []  # (title score, index, link) of the recipe pages not downloaded
+
+
+    def post(self, score):
+        """
+        Adds the closest title of one website
+        :param score: similarity score of the title, None if the website has no results or failed; int
+        :return: None
+        """
+        with self._lock:
+            self._pending -= 1
+            if score is not None and (self._best is None or score < self._best):
+                self._best = score
+            if self._pending <= 0:
+                self._done.set()
+
+    def worth_downloading(self, score):
+        """
+        Waits for the search results of the other websites (at most until the deadline), then compares the titles
+        :param score: similarity score of the title of this website; int
+        :return: True if no other website has a clearly closer title; bool
+        """
+        self._done.wait(max(self._deadline - monotonic(), 0))
+        with self._lock:
+            return self._best is None or score <= self._best + recipe_finder.TITLE_MARGIN
+
+    def skip(self, score, index, link):
+        """
+        Remembers a recipe page not downloaded because other websites have closer titles, name_to_recipe still
+        downloads it if none of them has a recipe
+        :param score: similarity score of the title; int
+        :param index: position of the website in the searched list; int
+        :param link: the web link of the recipe page; str
+        :return: None
+        """
+        with self._lock:
+            self.skipped.append((score, index, link))
+
+
+def _check_site(finder, name, index, results, board, known_recipe=None):
+    """
+    Worker for name_to_recipe, finds the search result closest to the name on one website and converts it, puts
+    (index, link, val, seconds) into results (val is None if the recipe page was not downloaded, the exception if
+    this program failed)
+    :param finder: the website to search; recipe_finder.Finder
     :param name: the dish name; String
-    :return: A two-tuple (name, HTML) -- the name of the dish and the HTML markdown of the recipe
+    :param index: position of the website in the searched list; int
+    :param results: queue to put the outcome into; queue.Queue
+    :param board: the closest titles of this search; _TitleBoard
+    :param known_recipe: (optional) function giving the standardized dictionary of an already imported link, or None
+    :return: None
+    """
+    start = monotonic()
+    link = None
+    posted = False
+    try:
+        with stage("search page", finder.website):
+            best = recipe_finder.best_result(name, finder.results(name))
+        board.post(None if best is None else best[0])
+        posted = True
+        if best is None:  # no results
+            val = -2
+        else:
+            score, link, title = best
+            recipe = None if known_recipe is None else known_recipe(link)
+            if recipe is not None:  # already imported, no need to download the recipe page
+                count("known_pages")
+                val = file_name(recipe), recipe, link
+            elif board.worth_downloading(score):
+                val = url_to_recipe(link)
+            else:  # other websites have closer titles
+                count("pages_skipped")
+                board.skip(score, index, link)
+                val = None
+    except requests.exceptions.RequestException:  # network error while searching the website
+        val = -3
+    except Exception as e:  # error of this program (e.g. no browser driver), not of the website: reported as is
+        val = e
+    if not posted:  # do not keep the other websites waiting
+        board.post(None)
+    results.put((index, link, val, monotonic() - start))
+
+
+NOT_WAITED = (None, None, None)  # outcome of a website not waited for, an earlier website had a near-exact match
+
+
+def settled_match(outcomes, exact_distance):
+    """
+    Get the first website (in search order) with a near-exact match once every website before it has reported, so
+    that stopping early gives the same result whichever website answers first
+    :param outcomes: (link, val, similarity score) per website in search order, None if it did not finish; list
+    :param exact_distance: largest similarity score counted as a near-exact match; int
+    :return: position of that website, None if the search must go on; int
+    """
+    for index, outcome in enumerate(outcomes):
+        if outcome is None:  # an earlier website could still win
+            return None
+        if outcome[2] is not None and outcome[2] <= exact_distance:
+            return index
+    return None
+
+
+def _search(finders, name, site_timeout, exact_distance, known_recipe):
+    """
+    Searches websites concurrently and records every lookup in the recipe_finder statistics
+    :param finders: the websites to search; list of recipe_finder.Finder
+    :param name: the dish name; String
+    :param site_timeout: seconds to wait for each website before giving up on it; float
+    :param exact_distance: stop waiting for later websites once a result is this close to the name; int
+    :param known_recipe: function giving the standardized dictionary of an already imported link, or None
+    :return: A two-tuple (outcomes, skipped) -- (link, val, similarity score) per website, None if it timed out,
+             NOT_WAITED if it comes after a near-exact match (see settled_match); (title score, index, link) of the
+             recipe pages not downloaded because other websites have closer titles
+    """
+    # Start all websites at once, daemon threads so a hanging website cannot keep the program alive
+    results = Queue()
+    board = _TitleBoard(len(finders), min(recipe_finder.SEARCH_WAIT, site_timeout))
+    for index, finder in enumerate(finders):
+        Thread(target=_check_site, args=(finder, name, index, results, board, known_recipe), daemon=True).start()
+
+    # Collect results as they arrive (each is fetched and parsed by its own thread)
+    outcomes = [None] * len(finders)
+    deadline = monotonic() + site_timeout
+    for _ in range(len(finders)):
+        try:
+            index, link, val, seconds = results.get(timeout=max(deadline - monotonic(), 0))
+        except Empty:  # remaining websites timed out, they count as errors for their circuit breakers
+            for finder, outcome in zip(finders, outcomes):
+                if outcome is None:
+                    recipe_finder.record(finder.website, "error", site_timeout)
+            break
+        score = matching.similarity(name, val[0]) if type(val) is tuple else None
+        outcomes[index] = (link, val, score)
+        if not isinstance(val, Exception):  # failures of this program do not count against the website
+            recipe_finder.record(finders[index].website, recipe_finder.outcome(link, val), seconds)
+        match = settled_match(outcomes, exact_distance)
+        if match is not None:  # near-exact match, later websites cannot win: ignore them even if they answered
+            outcomes[match + 1:] = [NOT_WAITED] * (len(outcomes) - match - 1)
+            break
+    return outcomes, board.skipped
+
+
+def name_to_recipe(name, site_timeout=120, exact_distance=0, known_recipe=None):
+    """
+    Uses recipe_finder.py to get the standardized dictionary from the name, the websites are searched concurrently
+    (best websites of recipe_finder.plan() first, the rarely winning ones only if those have no recipe), recipe pages
+    are downloaded for the search results whose titles are closest to the name first (the others only if those have
+    no recipe)
+    :param name: the dish name; String
+    :param site_timeout: seconds to wait for each website before giving up on it; float
+    :param exact_distance: stop waiting for other websites once a result is this close to the name; int
+    :param known_recipe: (optional) function giving the standardized dictionary of an already imported link, or None
+    :return: A three-tuple (name, recipe, url) -- the file name of the dish (with the website), the standardized
+             recipe dictionary and the web link
             Exceptions: 0 = could not find a recipe in the webpage, -1 = could not parse the recipe,
                                                                                         -2 = could not find dish name
     """
     lowest_levenshtein = 999999
     best_val = None
     best_link = None
+    best_website = None
     error_code = -2
 
-    # List of functions to use to find links
-    function_list = (recipe_finder.get_recipetineats_link, recipe_finder.get_allrecipes_link,
-                     recipe_finder.get_nyt_link, recipe_finder.get_seriouseats_link)
-    # List of websites (should correspond 1:1 with above function list) - only used for error messaging
-    website_list = ("www.recipetineats.com", "www.allrecipes.com", "cooking.nytimes.com", "www.seriouseats.com")
-
-    for func in range(len(function_list)):  # try all link from name functions
-        link = function_list[func](name)
-        if link is None:  # link not found
+    first, fallback, skipped = recipe_finder.plan()
+    for finder in skipped:
+        print(f'Skipped website "{finder.website}" after repeated errors (circuit breaker open)')
+    searched, outcomes, candidates = [], [], []
+    for finders in (first, fallback):
+        if not finders:
+            continue
+        found, skipped_pages = _search(finders, name, site_timeout, exact_distance, known_recipe)
+        candidates += [(score, len(searched) + index, link) for score, index, link in skipped_pages]
+        searched += finders
+        outcomes += found
+        if any(outcome is not None and outcome[2] is not None for outcome in outcomes):  # found a recipe
+            break
+
+    # Report and select in search order so output does not depend on which website answered first
+    for finder, outcome in zip(searched, outcomes):
+        if outcome is NOT_WAITED:
+            print(f'Website "{finder.website}" was not waited for, an earlier website has a near-exact match')
+            continue
+        if outcome is None:
+            print(f'Checking website "{finder.website}" timed out')
+            continue
+        link, val, score = outcome
+        if val is None:  # recipe page not downloaded
+            print(f'Skipped link "{link[:80]}", other websites have closer titles')
+        elif isinstance(val, Exception):  # failure of this program, e.g. no browser driver
+            error_code = -1
+            print(f'Checking website "{finder.website}" failed: {type(val).__name__}: {val}')
+        elif link is None and val == -2:  # link not found
             error_code = -2
-            print(f'Checked website "{website_list[func]}" with no results')
-
-        else:
-            val = url_to_html(link)
-            if val == 0 or val == -1 or val == -2:  # found link but issue finding or parsing recipe
+            print(f'Checked website "{finder.website}" with no results')
+        elif link is None:  # error while searching the website
+            error_code = val
+            print(f'Checked website "{finder.website}" with error code {error_code}')
+        elif score is None:  # found link but issue finding or parsing recipe
+            error_code = val
+            print(f'Checked link "{link[:80]}" with error code {error_code}')
+        else:  # everything successful
+            print(f'Checked link "{link[:80]}" successfully, similarity score = {score} '
+                  f'(smaller score is better)')
+            if score < lowest_levenshtein:  # if it is closer to user input
+                lowest_levenshtein = score
+                best_val = val
+                best_link = link
+                best_website = finder.website
+
+    if best_val is None:  # the closer titles had no recipe: download the skipped pages, closest title first
+        for title_score, index, link in sorted(candidates):
+            print(f'Checking skipped link "{link[:80]}", the websites with closer titles have no recipe')
+            try:
+                val = url_to_recipe(link)
+            except Exception as e:  # failure of this program, e.g. no browser driver
+                error_code = -1
+                print(f'Checking link "{link[:80]}" failed: {type(e).__name__}: {e}')
+                continue
+            if type(val) is not tuple:
                 error_code = val
                 print(f'Checked link "{link[:80]}" with error code {error_code}')
-            else:  # everything successful
-                current_levenshtein = recipe_finder.levenshtein(name, val[0])
-                print(f'Checked link "{link[:80]}" successfully, similarity score = {current_levenshtein} '
-                      f'(smaller score is better)')
-                if current_levenshtein < lowest_levenshtein:  # if it is closer to user input
-                    lowest_levenshtein = current_levenshtein
-                    best_val = val
-                    best_link = link
+                continue
+            print(f'Checked link "{link[:80]}" successfully, similarity score = {matching.similarity(name, val[0])} '
+                  f'(smaller score is better)')
+            best_val = val
+            best_link = link
+            best_website = searched[index].website
+            break
+
+    if best_website is not None:
+        recipe_finder.win(best_website)
+    recipe_finder.save()
 
     if best_val:  # at least one successful attempt
         # shorten url to domain name for displaying in file name
         start = best_link.find("//")
         end = best_link[start + 2::].find("/")
         new_name = best_val[0] + f" (from {best_link[start+2:start+end+2]})"  # add website source to file name
-        return new_name, best_val[1]
+        return new_name, best_val[1], best_link
     else:  # return latest error code
         return error_code
+
+
+def name_to_html(name, site_timeout=120, exact_distance=0):
+    """
+    Uses recipe_finder.py to get HTML from the name, all websites are searched concurrently
+    :param name: the dish name; String
+    :param site_timeout: seconds to wait for each website before giving up on it; float
+    :param exact_distance: stop waiting for other websites once a result is this close to the name; int
+    :return: A two-tuple (name, HTML) -- the name of the dish and the HTML markdown of the recipe
+            Exceptions: 0 = could not find a recipe in the webpage, -1 = could not parse the recipe,
+                                                                                        -2 = could not find dish name
+    """
+    val = name_to_recipe(name, site_timeout, exact_distance)
+    if type(val) is not tuple:  # error code
+        return val
+    with stage("render"):
+        return val[0], create_minimized_html(val[1])
@@ -3,38 +3,155 @@ from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
-import requests
-from selenium.common.exceptions import WebDriverException
+import http_client
+from selenium.common.exceptions import WebDriverException, TimeoutException
+from contextlib import contextmanager
+from threading import Lock, Semaphore
+import atexit
 
+MAX_BROWSERS = 4  # default limit of browsers running at the same time for many workers, each one is a whole Firefox
 
-def get_html_selenium(url):
-    print("Issue with website response, trying again with FireFox driver (should take ~30-60 seconds)...")
 
-    options = Options()
-    options.add_argument("--headless")
+class BrowserPool:
+    """
+    Pool of headless Firefox drivers, launched lazily and reused across pages
+    """
+    def __init__(self, size=1, max_pages=25):
+        """
+        :param size: maximum number of browsers running at the same time (pages rendered in parallel); int
+        :param max_pages: number of pages a browser renders before it is replaced by a fresh one; int
+        """
+        self.size = size
+        self.max_pages = max_pages
+        self._slots = Semaphore(size)
+        self._lock = Lock()
+        self._idle = []  # [driver, pages rendered] available for reuse
+        self._running = []  # every driver that has not been quit
+        self._closed = False
 
-    driver = webdriver.Firefox(options=options)
-    driver.get(url)
-    html = driver.page_source
+    def _launch(self):
+        """
+        Starts a new headless Firefox
+        :return: [driver, pages rendered]
+        """
+        options = Options()
+        options.add_argument("--headless")
+        item = [webdriver.Firefox(options=options), 0]
+        with self._lock:
+            self._running.append(item)
+        return item
 
-    if "yummly" in url:  # yummly has a "continue to directions" button that must be clicked
+    def _quit(self, item):
+        """
+        Quits a driver, ignoring errors from drivers that already crashed
+        :param item: [driver, pages rendered]
+        :return: None
+        """
+        with self._lock:
+            if item in self._running:
+                self._running.remove(item)
         try:
+            item[0].quit()
+        except WebDriverException:
+            pass
+
+    @contextmanager
+    def driver(self):
+        """
+        Borrows a driver from the pool, blocks while all browsers are busy. The driver is returned to the pool
+        afterwards, or quit if it raised a WebDriverException (crash) or reached max_pages
+        :return: context manager giving the driver
+        """
+        self._slots.acquire()
+        try:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Browser pool has been shut down")
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                item = self._launch()
+
+            healthy = False
             try:
-                button = WebDriverWait(driver, 30).until(
-                    ec.presence_of_element_located((
-                        By.XPATH, "/html/body/div[1]/div[1]/div[4]/div/div[6]/div[2]/div[3]/div[2]/div[3]/a"))
-                )
-                new_url = button.get_attribute("href")
+                yield item[0]
+                healthy = True
             finally:
-                driver.quit()
+                item[1] += 1
+                with self._lock:
+                    reuse = healthy and item[1] < self.max_pages and not self._closed
+                    if reuse:
+                        self._idle.append(item)
+                if not reuse:
+                    self._quit(item)
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        """
+        Quits every browser of the pool, the pool cannot be used afterwards
+        :return: None
+        """
+        with self._lock:
+            self._closed = True
+            running = list(self._running)
+            self._idle = []
+        for item in running:
+            self._quit(item)
+
+
+pool = BrowserPool()
+atexit.register(lambda: pool.shutdown())  # lambda: always shut down the current pool
+
 
-            new_url = new_url[:new_url.find("?")]  # remove any ?options
+def configure_pool(size=1, max_pages=25):
+    """
+    Replaces the browser pool, browsers of the previous pool are quit
+    :param size: maximum number of browsers running at the same time; int
+    :param max_pages: number of pages a browser renders before it is replaced; int
+    :return: None
+    """
+    global pool
+    old_pool = pool
+    pool = BrowserPool(size, max_pages)
+    old_pool.shutdown()
+
+
+def get_html_selenium(url, quiet=False):
+    """
+    Get HTML from a web link by rendering it in a pooled headless browser (for pages loaded by JS)
+    :param url: the web link; str
+    :param quiet: (optional) True to print nothing (e.g. async_api); bool
+    :return: the HTML markdown; str
+    """
+    if not quiet:
+        print("Issue with website response, trying again with FireFox driver (should take ~30-60 seconds)...")
+
+    html = None
+    new_url = None
+    try:
+        with pool.driver() as driver:
+            driver.get(url)
+            html = driver.page_source
+
+            if "yummly" in url:  # yummly has a "continue to directions" button that must be clicked
+                try:
+                    button = WebDriverWait(driver, 30).until(
+                        ec.presence_of_element_located((
+                            By.XPATH, "/html/body/div[1]/div[1]/div[4]/div/div[6]/div[2]/div[3]/div[2]/div[3]/a"))
+                    )
+                    new_url = button.get_attribute("href")
+                except TimeoutException:  # no button present - recipe on page
+                    pass
+    except WebDriverException:
+        if html is None:  # browser failed before the page was loaded
+            raise
+        return html  # most likely no button present - recipe on page
+
+    if new_url:
+        new_url = new_url.split("?")[0]  # remove any ?options
+        if not quiet:
             print(f"Yummly URL detected, found new URL {new_url}")
-            r = requests.get(new_url, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:110.0) Gecko/20100101 Firefox/110.0'})
-            return r.text
-        except WebDriverException:  # most likely no button present - recipe on page
-            return html
+        r = http_client.get(new_url)
+        return r.text
 
     return html
-
@@ -0,0 +1,238 @@
+import atexit
+import http_client
+import instrumentation
+import json
+from os import path, makedirs, remove, replace
+from hashlib import sha256
+from threading import Lock
+from time import time
+
+CACHE_DIR = path.join(path.dirname(path.abspath(__file__)), "cache")  # cache storage directory
+INDEX_FILE = "index.json"  # metadata of all cached responses, in CACHE_DIR
+
+enabled = True  # set to False to always use the network (recipe.py --no-cache)
+ttl = 24 * 60 * 60  # seconds a cached response is used without asking the server
+max_size = 200 * 1024 * 1024  # total size of cached bodies in bytes, least recently used are evicted above this
+
+stats = {"hits": 0, "revalidated": 0, "downloads": 0}  # fresh hits, 304 responses, full downloads
+
+_lock = Lock()
+_index = None  # {key: {"url", "etag", "last_modified", "fetched", "accessed", "size"}}, loaded on first use
+_dirty = False  # access times changed since the index was last written (written by flush(), at exit at the latest)
+
+
+def _key(url):
+    """
+    Get the cache key of a URL
+    :param url: the web link; str
+    :return: hex digest used as the file name of the cached body; str
+    """
+    return sha256(url.encode("utf-8")).hexdigest()
+
+
+def _body_path(key):
+    """
+    Get the file path of a cached body
+    :param key: the cache key; str
+    :return: the file path; str
+    """
+    return path.join(CACHE_DIR, key + ".html")
+
+
+def load_json(name):
+    """
+    Get a JSON file kept in the cache directory, e.g. state learned in earlier runs
+    :param name: the file name in CACHE_DIR; str
+    :return: the content of the file, an empty dict if it does not exist yet or is corrupted; dict
+    """
+    try:
+        with open(path.join(CACHE_DIR, name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):  # not written yet or corrupted file, start over
+        return {}
+
+
+def _write_json(name, data):
+    """
+    Writes a JSON file of the cache directory atomically, a crash leaves the previous version
+    :param name: the file name in CACHE_DIR; str
+    :param data: the content; dict
+    :return: None
+    """
+    makedirs(CACHE_DIR, exist_ok=True)
+    file_path = path.join(CACHE_DIR, name)
+    with open(file_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    replace(file_path + ".tmp", file_path)
+
+
+def save_json(name, data):
+    """
+    Writes a JSON file read back by load_json(), nothing is written while the cache is disabled (recipe.py --no-cache)
+    :param name: the file name in CACHE_DIR; str
+    :param data: the content; dict
+    :return: None
+    """
+    if enabled:
+        _write_json(name, data)
+
+
+def _load_index():
+    """
+    Get the cache index, reads it from disk on first use (must hold _lock)
+    :return: the cache index; dict
+    """
+    global _index
+    if _index is None:
+        _index = load_json(INDEX_FILE)
+    return _index
+
+
+def _save_index():
+    """
+    Writes the cache index to disk (must hold _lock)
+    :return: None
+    """
+    global _dirty
+    _dirty = False
+    _write_json(INDEX_FILE, _index)
+
+
+def _evict():
+    """
+    Removes least recently used bodies until the cache is below max_size (must hold _lock)
+    :return: None
+    """
+    total = sum(entry["size"] for entry in _index.values())
+    for key in sorted(_index, key=lambda k: _index[k]["accessed"]):
+        if total <= max_size:
+            break
+        total -= _index.pop(key)["size"]
+        try:
+            remove(_body_path(key))
+        except OSError:
+            pass
+
+
+def _read(key):
+    """
+    Get a cached body (must hold _lock)
+    :param key: the cache key; str
+    :return: the cached text; str, None if the body file is missing
+    """
+    try:
+        with open(_body_path(key), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        _index.pop(key, None)
+        return None
+
+
+def _store(key, url, response, text, complete=True):
+    """
+    Writes a response body and its validators to the cache (must hold _lock)
+    :param key: the cache key; str
+    :param url: the web link; str
+    :param response: the response to store; requests.Response
+    :param text: the body; str
+    :param complete: False if only the beginning of the body was downloaded; bool
+    :return: None
+    """
+    makedirs(CACHE_DIR, exist_ok=True)
+    data = text.encode("utf-8")
+    with open(_body_path(key), "wb") as f:
+        f.write(data)
+    now = time()
+    _index[key] = {"url": url, "etag": response.headers.get("ETag"),
+                   "last_modified": response.headers.get("Last-Modified"),
+                   "fetched": now, "accessed": now, "size": len(data), "complete": complete}
+    _evict()
+    _save_index()
+
+
+def get(url, headers=None, until=None):
+    """
+    Get the text of a web page, from the cache if it is fresh, otherwise revalidated or downloaded and cached
+    :param url: the web link; str
+    :param headers: (optional) request headers; dict
+    :param until: (optional) function(text chunk) -> True once the rest of the page is not needed, the download is
+                  stopped there (see http_client.get_text); callable
+    :return: the page text, only its beginning if until() stopped the download; str
+    """
+    global _dirty
+    if not enabled:
+        return http_client.get_text(url, until, headers=headers)[1]
+
+    key = _key(url)
+    with _lock:
+        entry = _load_index().get(key)
+        if entry is not None and until is None and not entry.get("complete", True):  # full page needed this time
+            entry = None
+        if entry is not None and time() - entry["fetched"] < ttl:  # fresh, no network needed
+            text = _read(key)
+            if text is not None:
+                entry["accessed"] = time()  # only needed for eviction, written with the next change or by flush()
+                _dirty = True
+                stats["hits"] += 1
+                instrumentation.count("cache_hits")
+                return text
+            entry = None
+
+    # stale or missing: ask the server, conditionally if we have validators
+    headers = dict(headers or {})
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    r, text, complete = http_client.get_text(url, until, headers=headers)
+
+    if r.status_code == 304 and entry is not None:  # not modified, reuse cached body
+        with _lock:
+            text = _read(key)
+            if text is not None:
+                entry["fetched"] = entry["accessed"] = time()
+                stats["revalidated"] += 1
+                instrumentation.count("cache_revalidated")
+                _index[key] = entry
+                _save_index()
+                return text
+        # cached body disappeared in the meantime, download it again unconditionally
+        r, text, complete = http_client.get_text(url, until, headers={k: v for k, v in headers.items()
+                                                                      if not k.startswith("If-")})
+
+    with _lock:
+        stats["downloads"] += 1
+    instrumentation.count("cache_downloads")
+    if r.status_code == 200:
+        with _lock:
+            _load_index()
+            _store(key, url, r, text, complete)
+    return text
+
+
+def clear():
+    """
+    Removes every cached response
+    :return: None
+    """
+    global _index
+    with _lock:
+        for key in _load_index():
+            try:
+                remove(_body_path(key))
+            except OSError:
+                pass
+        _index = {}
+        _save_index()
+
+
+@atexit.register
+def flush():
+    """
+    Writes the access times of fresh hits to disk, the index is not rewritten for every hit
+    :return: None
+    """
+    with _lock:
+        if _dirty and _index is not None:
+            _save_index()
@@ -0,0 +1,169 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+from threading import Lock
+from time import perf_counter
+import scheduler
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:110.0) Gecko/20100101 Firefox/110.0'
+TIMEOUT = (5, 30)  # (connect, read) seconds
+POOL_SIZE = 16  # kept-alive connections per host
+CHUNK_SIZE = 16 * 1024  # bytes read at a time by get_text
+# 429 and 503 are not retried here: urllib3 would sleep for their Retry-After while holding the slot of the host,
+# they are retried by request() and get_text() once the scheduler has waited (see scheduler.busy)
+RETRY = Retry(total=3, connect=3, read=2, backoff_factor=0.5, status_forcelist=(500, 502, 504),
+              allowed_methods=frozenset({"GET", "HEAD"}), respect_retry_after_header=False,
+              raise_on_status=False)  # the last response is returned even if its status is still an error
+BUSY_RETRIES = 2  # times a 429 or 503 response is sent again
+
+try:  # brotli is optional, only advertised if urllib3 can decode it
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+url_rewriter = None  # optional function(url) -> url applied to every request, e.g. fixture_server.py
+_session = None
+_lock = Lock()
+host_stats = {}  # {host: {"requests", "failed", "seconds", "max_seconds", "bytes"}} running totals, see format_stats()
+
+
+def session():
+    """
+    Get the shared session, created on first use: one connection pool per host, kept alive between requests
+    :return: the shared session; requests.Session
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=RETRY)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING})
+        return _session
+
+
+def request(method, url, **kwargs):
+    """
+    Sends a request with the shared session, default timeouts and retries with backoff, the time is recorded.
+    The request waits for the limits of its host and robots.txt (see scheduler.py)
+    :param method: HTTP method (GET, HEAD); str
+    :param url: the web link; str
+    :param kwargs: further arguments for requests (headers, allow_redirects, stream, ...)
+    :return: the response; requests.Response
+    :raise scheduler.RobotsDisallowed: robots.txt does not allow the web link (a RequestException)
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    scheduler.check_robots(url)
+    start = perf_counter()
+    status = None
+    try:
+        for attempt in range(BUSY_RETRIES + 1):
+            with scheduler.slot(url) as slot:  # waits for the Retry-After of the previous attempt
+                slot.response = r = session().request(method, url if url_rewriter is None else url_rewriter(url),
+                                                      **kwargs)
+            if attempt == BUSY_RETRIES or not scheduler.busy(r):
+                break
+            r.close()
+        status = r.status_code
+        return r
+    finally:
+        record(url, status, perf_counter() - start,
+               len(r.content) if status is not None and not kwargs.get("stream") else 0)
+
+
+def record(url, status, seconds, size):
+    """
+    Adds a request to the statistics printed by format_stats() (for requests not sent with the shared session)
+    :param url: the web link; str
+    :param status: the response status, None if no response was received; int
+    :param seconds: time taken by the request; float
+    :param size: bytes received; int
+    :return: None
+    """
+    host = urlparse(url).netloc
+    with _lock:
+        totals = host_stats.get(host)
+        if totals is None:
+            totals = host_stats[host] = {"requests": 0, "failed": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0}
+        totals["requests"] += 1
+        if status is None or status >= 400:
+            totals["failed"] += 1
+        totals["seconds"] += seconds
+        totals["max_seconds"] = max(totals["max_seconds"], seconds)
+        totals["bytes"] += size
+
+
+def get(url, **kwargs):
+    """
+    Sends a GET request with the shared session (see request())
+    :param url: the web link; str
+    :return: the response; requests.Response
+    """
+    return request("GET", url, **kwargs)
+
+
+def get_text(url, until=None, **kwargs):
+    """
+    Sends a GET request and reads the body as text chunk by chunk, the download stops (and the connection is closed)
+    as soon as until() returns True, e.g. json_ld.RecipeScanner().feed
+    :param url: the web link; str
+    :param until: (optional) function(text chunk) -> True if the rest of the body is not needed; callable
+    :param kwargs: further arguments for requests (headers, ...)
+    :return: three-tuple (response, text read, True if the whole body was read); (requests.Response, str, bool)
+    :raise scheduler.RobotsDisallowed: robots.txt does not allow the web link (a RequestException)
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    scheduler.check_robots(url)
+    start = perf_counter()
+    r = None
+    complete = False
+    try:
+        for attempt in range(BUSY_RETRIES + 1):
+            with scheduler.slot(url) as slot:  # held until the body has been read
+                slot.response = r = session().get(url if url_rewriter is None else url_rewriter(url), stream=True,
+                                                  **kwargs)
+                if attempt < BUSY_RETRIES and scheduler.busy(r):  # sent again once the scheduler has waited
+                    r.close()
+                    continue
+                if r.encoding is None:  # not a text content type, same default as requests
+                    r.encoding = "utf-8"
+                chunks = []
+                for chunk in r.iter_content(CHUNK_SIZE, decode_unicode=True):
+                    chunks.append(chunk)
+                    if until is not None and until(chunk):
+                        break
+                else:
+                    complete = True
+            return r, "".join(chunks), complete
+    finally:
+        if r is not None:
+            r.close()  # returns the connection to the pool, or drops it if the body was not read to the end
+        record(url, None if r is None else r.status_code, perf_counter() - start,
+               0 if r is None else r.raw.tell())
+
+
+def head(url, **kwargs):
+    """
+    Sends a HEAD request with the shared session (see request())
+    :param url: the web link; str
+    :return: the response; requests.Response
+    """
+    return request("HEAD", url, **kwargs)
+
+
+def format_stats():
+    """
+    Get a per-host summary of the requests made so far
+    :return: printable summary; str
+    """
+    with _lock:
+        hosts = {host: dict(totals) for host, totals in host_stats.items()}
+    lines = ["{} requests, {:.2f}s total".format(sum(t["requests"] for t in hosts.values()),
+                                                 sum(t["seconds"] for t in hosts.values()))]
+    for host, totals in sorted(hosts.items()):
+        lines.append("  {}: {requests} requests ({failed} failed), avg {:.2f}s, max {max_seconds:.2f}s, {:.0f} KB"
+                     .format(host, totals["seconds"] / totals["requests"], totals["bytes"] / 1000, **totals))
+    return "\n".join(lines)
@@ -0,0 +1,162 @@
+import json
+import threading
+from threading import Lock, current_thread
+from time import perf_counter, time
+
+enabled = False  # while False, stage() and count() do nothing (recipe.py --profile enables it)
+
+_lock = Lock()
+_timings = {}  # stage -> [calls, total seconds, max seconds]
+_counters = {}  # counter -> value
+_sink = None  # open file receiving one JSON line per finished stage
+_profilers = []  # cProfile.Profile of the calling thread and of every thread started since start_profile()
+
+
+class _NullStage:
+    """
+    Stage timer used while instrumentation is disabled, shared and does nothing
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """
+    Times one run of a pipeline stage
+    """
+    def __init__(self, name, detail):
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *args):
+        seconds = perf_counter() - self.start
+        with _lock:
+            timing = _timings.setdefault(self.name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            if _sink is not None:
+                _sink.write(json.dumps({"ts": time(), "stage": self.name, "detail": self.detail,
+                                        "seconds": round(seconds, 6), "ok": exc_type is None,
+                                        "thread": current_thread().name}) + "\n")
+        return False
+
+
+def stage(name, detail=None):
+    """
+    Get a context manager timing a pipeline stage, e.g. "with stage('get_recipe'):"
+    :param name: the stage name; str
+    :param detail: (optional) extra information for the JSON lines (URL, website...); str
+    :return: context manager
+    """
+    if not enabled:
+        return NULL_STAGE
+    return _Stage(name, detail)
+
+
+def count(name, amount=1):
+    """
+    Increments a counter
+    :param name: the counter name; str
+    :param amount: (optional) increment; int
+    :return: None
+    """
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def enable(jsonl_path=None):
+    """
+    Starts collecting timings and counters
+    :param jsonl_path: (optional) file to append one JSON line per finished stage to, for a metrics collector; str
+    :return: None
+    """
+    global enabled, _sink
+    with _lock:
+        if jsonl_path is not None and _sink is None:
+            _sink = open(jsonl_path, "a", encoding="utf-8")
+        enabled = True
+
+
+def disable():
+    """
+    Stops collecting and closes the JSON lines file, collected timings are kept for report()
+    :return: None
+    """
+    global enabled, _sink
+    with _lock:
+        enabled = False
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+
+def report():
+    """
+    Get the per-stage breakdown, slowest total first (stages run in parallel threads can add up to more than the
+    wall time)
+    :return: printable table; str
+    """
+    with _lock:
+        timings = sorted(_timings.items(), key=lambda item: -item[1][1])
+        counters = sorted(_counters.items())
+    lines = ["{:<24}{:>7}{:>11}{:>11}{:>11}".format("stage", "calls", "total s", "avg s", "max s")]
+    for name, (calls, total, longest) in timings:
+        lines.append("{:<24}{:>7}{:>11.3f}{:>11.3f}{:>11.3f}".format(name, calls, total, total / calls, longest))
+    for name, value in counters:
+        lines.append("{:<24}{:>7}".format(name, value))
+    return "\n".join(lines)
+
+
+def _profile_thread(*args):
+    """
+    Profile hook of new threads (see threading.setprofile), replaces itself by a profiler of the thread
+    :return: None
+    """
+    from cProfile import Profile
+    profiler = Profile()
+    with _lock:
+        _profilers.append(profiler)
+    profiler.enable()
+
+
+def start_profile():
+    """
+    Starts a function level profile of the calling thread and of every thread started afterwards (search websites,
+    batch workers...), each thread has its own profiler
+    :return: None
+    """
+    from cProfile import Profile
+    profiler = Profile()
+    with _lock:
+        _profilers[:] = [profiler]
+    threading.setprofile(_profile_thread)
+    profiler.enable()
+
+
+def stop_profile(file_path):
+    """
+    Stops the profile started by start_profile() and saves the merged profile of all threads
+    :param file_path: file to save the profile to (view with python -m pstats); str
+    :return: None
+    """
+    from pstats import Stats
+    threading.setprofile(None)
+    with _lock:
+        profilers = _profilers[:]
+        _profilers.clear()
+    profilers[0].disable()  # profile of the calling thread, the threads still running are read as they are
+    stats = Stats(profilers[0])
+    stats.add(*profilers[1:])
+    stats.dump_stats(file_path)
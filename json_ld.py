@@ -0,0 +1,143 @@
+import json
+import re
+from collections import deque
+
+# <script type="application/ld+json"> blocks, attributes in any order and either quote style
+SCRIPT_PATTERN = re.compile(r'<script\b[^>]*?type\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>',
+                            re.IGNORECASE | re.DOTALL)
+# "@type": "Recipe" or "@type": ["Recipe", ...] anywhere in the document (used when there are no script blocks)
+RECIPE_TYPE_PATTERN = re.compile(r'"@type"\s*:\s*(?:\[[^\]]*?)?"Recipe"')
+# opening <script> tag, group 2 is empty while the tag is not complete yet (streaming, see RecipeScanner)
+SCRIPT_TAG_PATTERN = re.compile(r'<script\b([^>]*)(>?)', re.IGNORECASE)
+DECODER = json.JSONDecoder(strict=False)  # strict=False: some websites leave raw newlines inside strings
+MAX_FALLBACK_ATTEMPTS = 64  # maximum number of '{' to try decoding from, per "@type" match
+
+
+def is_recipe(node):
+    """
+    Checks if a JSON-LD node is a recipe
+    :param node: the JSON-LD node; dict
+    :return: True if "@type" is "Recipe" or a list containing "Recipe"; bool
+    """
+    typ = node.get("@type")
+    if type(typ) is list:
+        return "Recipe" in typ
+    return typ == "Recipe"
+
+
+def iter_nodes(data):
+    """
+    Iterates over every object in a JSON-LD document breadth first (top level, "@graph" arrays, nested objects)
+    :param data: the parsed JSON-LD document; dict or list
+    :return: generator of JSON-LD nodes; dict
+    """
+    queue = deque([data])
+    while queue:
+        item = queue.popleft()
+        if type(item) is dict:
+            yield item
+            queue.extend(value for value in item.values() if type(value) in (dict, list))
+        elif type(item) is list:
+            queue.extend(value for value in item if type(value) in (dict, list))
+
+
+def iter_json_ld(html):
+    """
+    Parses every <script type="application/ld+json"> block of a page in one pass, invalid blocks are skipped
+    :param html: the HTML code; str
+    :return: generator of parsed JSON-LD documents; dict or list
+    """
+    for match in SCRIPT_PATTERN.finditer(html):
+        try:
+            yield DECODER.decode(match.group(1).strip())
+        except ValueError:  # invalid JSON, ignore this block
+            continue
+
+
+def find_recipe_in_scripts(html):
+    """
+    Get the first recipe from the JSON-LD script blocks of a page
+    :param html: the HTML code; str
+    :return: recipe JSON object; dict, None if no recipe found
+    """
+    for document in iter_json_ld(html):
+        for node in iter_nodes(document):
+            if is_recipe(node):
+                return node
+
+
+def find_recipe_anywhere(html):
+    """
+    Get the first recipe object embedded anywhere in a page (e.g. in framework state instead of a JSON-LD block),
+    decodes in place from the '{' before each "@type" match without copying the page
+    :param html: the HTML code; str
+    :return: recipe JSON object; dict, None if no recipe found
+    """
+    for match in RECIPE_TYPE_PATTERN.finditer(html):
+        j = match.start()
+        for _ in range(MAX_FALLBACK_ATTEMPTS):  # try enclosing objects from the innermost outwards
+            j = html.rfind("{", 0, j)
+            if j == -1:
+                break
+            try:
+                obj, end = DECODER.raw_decode(html, j)
+            except ValueError:
+                continue
+            if end > match.end() and type(obj) is dict:
+                for node in iter_nodes(obj):
+                    if is_recipe(node):
+                        return node
+
+
+def find_recipe(html):
+    """
+    Get JSON formatted recipe from a page, JSON-LD script blocks first then anywhere else in the page
+    :param html: the HTML code; str
+    :return: recipe JSON object; dict, None if no recipe found
+    """
+    recipe = find_recipe_in_scripts(html)
+    if recipe is None:
+        recipe = find_recipe_anywhere(html)
+    return recipe
+
+
+class RecipeScanner:
+    """
+    Incremental version of find_recipe_in_scripts for pages arriving in chunks: each complete JSON-LD block is parsed
+    as soon as it has arrived, only the text after the last complete block is searched again
+    """
+    def __init__(self):
+        self.recipe = None  # the first recipe found; dict
+        self._tail = ""  # text that may still contain the start of a JSON-LD block
+
+    def feed(self, chunk):
+        """
+        Scans the next chunk of the page
+        :param chunk: the text following the previous chunk; str
+        :return: True once a complete recipe has been found, the rest of the page is not needed; bool
+        """
+        if self.recipe is not None:
+            return True
+        self._tail += chunk
+        end = 0
+        for match in SCRIPT_PATTERN.finditer(self._tail):
+            end = match.end()
+            try:
+                document = DECODER.decode(match.group(1).strip())
+            except ValueError:  # invalid JSON, ignore this block
+                continue
+            for node in iter_nodes(document):
+                if is_recipe(node):
+                    self.recipe = node
+                    self._tail = ""
+                    return True
+
+        # keep the text from the first block that is not complete yet (a "<script" may be cut between chunks)
+        keep = max(len(self._tail) - len("<script"), end)
+        for tag in SCRIPT_TAG_PATTERN.finditer(self._tail, end):
+            if not tag.group(2) or "ld+json" in tag.group(1).lower():  # tag or JSON-LD block still arriving
+                keep = min(keep, tag.start())
+                break
+        self._tail = self._tail[keep:]
+        return False
+
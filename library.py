@@ -0,0 +1,230 @@
+import sqlite3
+import json
+from os import path, remove
+from threading import Lock
+from time import time
+import matching
+from canonical_url import canonicalize
+
+LIBRARY_NAME = "recipe_library.db"  # index file, stored in the recipe storage directory
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (id INTEGER PRIMARY KEY, name TEXT, path TEXT UNIQUE, url TEXT, saved REAL,
+                                    data TEXT);
+CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, path TEXT);
+CREATE TABLE IF NOT EXISTS validators (path TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, checked REAL);
+CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(name, ingredients, instructions,
+                                                          tokenize='unicode61 remove_diacritics 2');
+"""
+
+
+def fts_query(text, column=None):
+    """
+    Builds a full text query matching every word of a text, punctuation cannot break the query syntax
+    :param text: the words to look for; str
+    :param column: (optional) only match in this column (name, ingredients or instructions); str
+    :return: the FTS5 query; str, None if the text has no words
+    """
+    words = matching.normalize(text).split()
+    if not words:
+        return None
+    prefix = "{} : ".format(column) if column else ""
+    return " AND ".join('{}"{}"'.format(prefix, word) for word in words)
+
+
+class RecipeLibrary:
+    """
+    Saved recipes of a recipe storage directory: the standardized dictionary of each recipe is stored in a .json file
+    next to its .html file and indexed (names, ingredients, instructions) in an SQLite full text index
+    """
+    def __init__(self, recipes_path):
+        """
+        :param recipes_path: recipe storage directory; str
+        """
+        self.recipes_path = recipes_path
+        self._lock = Lock()  # one connection shared by batch workers
+        self._db = sqlite3.connect(path.join(recipes_path, LIBRARY_NAME), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.executescript(SCHEMA)
+
+    def add(self, cleaned_recipe, html_path, url=None):
+        """
+        Stores a saved recipe, replacing any entry with the same HTML file
+        :param cleaned_recipe: the standardized recipe dictionary
+        :param html_path: path of the saved HTML file; str
+        :param url: (optional) the web link the recipe came from; str
+        :return: None
+        """
+        saved = time()
+        with open(path.splitext(html_path)[0] + ".json", "w", encoding="utf-8") as f:
+            json.dump({"url": url, "saved": saved, "recipe": cleaned_recipe}, f, ensure_ascii=False, indent=1)
+
+        data = json.dumps(cleaned_recipe, ensure_ascii=False)
+        ingredients = "\n".join(str(i) for i in cleaned_recipe["recipeIngredients"])
+        instructions = "\n".join(str(i) for i in cleaned_recipe["recipeInstructions"])
+        with self._lock, self._db:
+            self._delete(html_path)
+            cursor = self._db.execute("INSERT INTO recipes (name, path, url, saved, data) VALUES (?, ?, ?, ?, ?)",
+                                      (str(cleaned_recipe["name"]), html_path, url, saved, data))
+            self._db.execute("INSERT INTO recipes_fts (rowid, name, ingredients, instructions) VALUES (?, ?, ?, ?)",
+                             (cursor.lastrowid, str(cleaned_recipe["name"]), ingredients, instructions))
+            if url:
+                self._db.execute("INSERT OR REPLACE INTO urls (url, path) VALUES (?, ?)",
+                                 (canonicalize(url), html_path))
+
+    def add_url(self, url, html_path):
+        """
+        Remembers another web link (e.g. before redirects) of a saved recipe
+        :param url: the web link; str
+        :param html_path: path of the saved HTML file; str
+        :return: None
+        """
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO urls (url, path) VALUES (?, ?)", (canonicalize(url), html_path))
+
+    def lookup_url(self, url):
+        """
+        Finds the saved recipe of a web link, any link with the same canonical form matches (no network)
+        :param url: the web link; str
+        :return: the saved recipe; dict (name, path, url, saved), None if the link was never imported
+        """
+        with self._lock:
+            row = self._db.execute("SELECT r.name, r.path, r.url, r.saved FROM urls u "
+                                   "JOIN recipes r ON r.path = u.path WHERE u.url = ?",
+                                   (canonicalize(url),)).fetchone()
+        if row is None:
+            return None
+        if not path.isfile(row["path"]):  # saved file was deleted by the user
+            self.remove(row["path"])
+            return None
+        return dict(row)
+
+    def recipe_for_url(self, url):
+        """
+        Get the standardized dictionary of an already imported web link (no network)
+        :param url: the web link; str
+        :return: the standardized recipe dictionary, None if the link was never imported
+        """
+        saved = self.lookup_url(url)
+        return None if saved is None else self.load(saved["path"])
+
+    def _delete(self, html_path):
+        """
+        Removes the index entry of an HTML file, its other web links are kept (see add_url) for the entry that
+        replaces it (must hold _lock)
+        :param html_path: path of the saved HTML file; str
+        :return: None
+        """
+        row = self._db.execute("SELECT id FROM recipes WHERE path = ?", (html_path,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM recipes WHERE id = ?", (row["id"],))
+            self._db.execute("DELETE FROM recipes_fts WHERE rowid = ?", (row["id"],))
+        self._db.execute("DELETE FROM validators WHERE path = ?", (html_path,))
+
+    def remove(self, html_path):
+        """
+        Removes a recipe from the library, its .json file is deleted (the HTML file is left alone)
+        :param html_path: path of the saved HTML file; str
+        :return: None
+        """
+        with self._lock, self._db:
+            self._delete(html_path)
+            self._db.execute("DELETE FROM urls WHERE path = ?", (html_path,))
+        try:
+            remove(path.splitext(html_path)[0] + ".json")
+        except OSError:
+            pass
+
+    def _query(self, query, limit):
+        """
+        Runs a full text query, entries whose HTML file was deleted are dropped from the library
+        :param query: the FTS5 query; str
+        :param limit: maximum number of results; int
+        :return: list of results, best first; list of dict (name, path, url, saved)
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT r.name, r.path, r.url, r.saved FROM recipes_fts JOIN recipes r "
+                                    "ON r.id = recipes_fts.rowid WHERE recipes_fts MATCH ? ORDER BY rank LIMIT ?",
+                                    (query, limit)).fetchall()
+        results = []
+        for row in rows:
+            if path.isfile(row["path"]):
+                results.append(dict(row))
+            else:  # saved file was deleted by the user
+                self.remove(row["path"])
+        return results
+
+    def search(self, text, limit=10):
+        """
+        Searches names, ingredients and instructions for every word of a text
+        :param text: the words to look for; str
+        :param limit: maximum number of results; int
+        :return: list of results, best first; list of dict (name, path, url, saved)
+        """
+        query = fts_query(text)
+        return [] if query is None else self._query(query, limit)
+
+    def find(self, dish, max_distance=None):
+        """
+        Finds the saved recipe for a dish name, every word must be in the recipe name
+        :param dish: the dish name; str
+        :param max_distance: (optional) largest accepted normalized distance between dish and recipe name; int
+        :return: the closest result; dict (name, path, url, saved), None if no saved recipe matches
+        """
+        query = fts_query(dish, column="name")
+        if query is None:
+            return None
+        results = self._query(query, 20)
+        ranked = matching.rank(dish, [result["name"] for result in results], max_distance)
+        return results[ranked[0][1]] if ranked else None
+
+    def load(self, html_path):
+        """
+        Get the standardized dictionary of a saved recipe
+        :param html_path: path of the saved HTML file; str
+        :return: the standardized recipe dictionary, None if the file is not in the library
+        """
+        with self._lock:
+            row = self._db.execute("SELECT data FROM recipes WHERE path = ?", (html_path,)).fetchone()
+        return None if row is None else json.loads(row["data"])
+
+    def validators(self, html_path):
+        """
+        Get the validators of the page version a saved recipe was last checked against (see recipe.py --refresh)
+        :param html_path: path of the saved HTML file; str
+        :return: two-tuple (ETag, Last-Modified), (None, None) if the recipe was never checked
+        """
+        with self._lock:
+            row = self._db.execute("SELECT etag, last_modified FROM validators WHERE path = ?",
+                                   (html_path,)).fetchone()
+        return (None, None) if row is None else (row["etag"], row["last_modified"])
+
+    def set_validators(self, html_path, etag, last_modified):
+        """
+        Remembers the validators of the page version a saved recipe matches
+        :param html_path: path of the saved HTML file; str
+        :param etag: ETag of the page, or None; str
+        :param last_modified: Last-Modified of the page, or None; str
+        :return: None
+        """
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO validators (path, etag, last_modified, checked) "
+                             "VALUES (?, ?, ?, ?)", (html_path, etag, last_modified, time()))
+
+    def entries(self):
+        """
+        Get every saved recipe, in the order they were saved
+        :return: list of (standardized recipe dictionary, path of the saved HTML file, web link, saved time)
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT data, path, url, saved FROM recipes ORDER BY saved, id").fetchall()
+        return [(json.loads(row["data"]), row["path"], row["url"], row["saved"]) for row in rows]
+
+    def close(self):
+        """
+        Closes the index
+        :return: None
+        """
+        with self._lock:
+            self._db.close()
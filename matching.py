@@ -0,0 +1,92 @@
+import re
+from unicodedata import normalize as unicode_normalize, combining
+
+NON_WORD_PATTERN = re.compile(r"[\W_]+")  # punctuation, symbols and whitespace
+
+
+def normalize(text):
+    """
+    Normalizes a title for comparison: accents removed, case folded, punctuation replaced by single spaces
+    :param text: the title; str
+    :return: the normalized title; str
+    """
+    decomposed = unicode_normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not combining(c))
+    return NON_WORD_PATTERN.sub(" ", stripped.casefold()).strip()
+
+
+def distance(str_a, str_b, max_distance=None):
+    """
+    Calculates the Levenshtein distance of two strings with the bit-parallel algorithm (Myers/Hyyrö), one column of
+    the distance matrix is a single int, stops early once max_distance can no longer be met
+    :param str_a: the first string; str
+    :param str_b: the second string; str
+    :param max_distance: (optional) bound, larger distances are all reported as max_distance + 1; int
+    :return: the Levenshtein distance; int
+    """
+    if len(str_a) < len(str_b):  # bit vectors over the shorter string
+        str_a, str_b = str_b, str_a
+    if max_distance is not None and len(str_a) - len(str_b) > max_distance:  # length difference alone is too much
+        return max_distance + 1
+
+    m = len(str_b)
+    score = len(str_a) if m == 0 else m
+    if m > 0:
+        peq = {}  # bit mask of the positions of each character in str_b
+        for i, char in enumerate(str_b):
+            peq[char] = peq.get(char, 0) | (1 << i)
+        full = (1 << m) - 1
+        last = 1 << (m - 1)
+        pv = full  # positive vertical deltas
+        mv = 0  # negative vertical deltas
+        remaining = len(str_a)
+        for char in str_a:
+            eq = peq.get(char, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            ph = ((ph << 1) | 1) & full
+            mh = (mh << 1) & full
+            pv = (mh | ~(xv | ph)) & full
+            mv = ph & xv
+            remaining -= 1
+            if max_distance is not None and score - remaining > max_distance:  # cannot come back under the bound
+                return max_distance + 1
+
+    if max_distance is not None and score > max_distance:
+        return max_distance + 1
+    return score
+
+
+def similarity(query, title, max_distance=None):
+    """
+    Calculates the distance between a dish name and a recipe title after normalizing both
+    :param query: the dish name; str
+    :param title: the recipe title; str
+    :param max_distance: (optional) bound, see distance(); int
+    :return: the Levenshtein distance of the normalized strings (smaller is better); int
+    """
+    return distance(normalize(query), normalize(title), max_distance)
+
+
+def rank(query, titles, max_distance=None):
+    """
+    Ranks many titles against one dish name, the query is normalized only once
+    :param query: the dish name; str
+    :param titles: the recipe titles; list of str
+    :param max_distance: (optional) titles further away than this are left out; int
+    :return: list of (distance, index in titles) sorted best first, ties keep the order of titles
+    """
+    normalized_query = normalize(query)
+    ranked = []
+    for index, title in enumerate(titles):
+        score = distance(normalized_query, normalize(title), max_distance)
+        if max_distance is None or score <= max_distance:
+            ranked.append((score, index))
+    ranked.sort()
+    return ranked
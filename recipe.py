@@ -1,9 +1,12 @@
 # EXTERNAL LIBRARIES AND FUNCTIONS
-from generate_html import url_to_html
-from generate_html import name_to_html
-from generate_html import create_minimized_html
+# (modules using the network, the browser or the parsers are imported by the functions needing them, so that the
+# usage screen, manual mode and library searches start quickly, see benchmark.py check_startup)
+from instrumentation import stage
+import instrumentation
 import sys
-from webbrowser import open_new
+from os import getcwd
+from os import path
+from threading import Lock
 from urllib.parse import unquote
 
 
@@ -20,6 +23,359 @@ def google_url_cleaner(google_url):
     return unquote(url3)
 
 
+# ARGUMENT FUNCTIONS
+OPTIONS = {"--open", "--no-cache", "--online", "--search", "--stats", "--profile", "--refresh"}  # all accepted options
+VALUE_OPTIONS = {"--batch", "--workers", "--browsers", "--summary", "--cprofile", "--metrics", "--rate", "--export",
+                 "--import"}  # options with a value
+
+
+def parse_options(args):
+    """
+    Separates options from the rest of the arguments
+    :param args: list of arguments; [Link or Name of dish / "manual", Options]
+    :return: two-tuple (list of non-option arguments, dictionary of given options -> value or True)
+    """
+    words = []
+    options = {}
+    i = 0
+    while i < len(args):
+        if args[i] in OPTIONS:
+            options[args[i]] = True
+        elif args[i] in VALUE_OPTIONS and i + 1 < len(args):
+            options[args[i]] = args[i + 1]
+            i += 1
+        else:
+            words.append(args[i])
+        i += 1
+    return words, options
+
+
+def entry_to_url(arg):
+    """
+    Get the URL from a command, if it is one
+    :param arg: the command (link or dish name)
+    :return: the URL; str, None if the command is a dish name
+    """
+    if "http" not in arg:  # user inputted dish name, get URL from name
+        return None
+    if "www.google.com" in arg:  # handle google redirect URL
+        return google_url_cleaner(arg)
+    return arg
+
+
+# SAVING FUNCTIONS
+ERROR_MESSAGES = {0: "We could not find a recipe there", -1: "We could not parse the recipe",
+                  -2: 'We could not find the dish "{}"', -3: "Network error"}
+save_lock = Lock()  # file name selection and creation must not interleave between batch workers
+SAVED_DISTANCE = 0.25  # largest distance between a dish name and a saved recipe name, per character of the dish name
+
+
+def find_saved(library, entered_dish_name):
+    """
+    Looks for an already saved recipe of a dish name or URL in the library before any page is downloaded
+    (URLs are canonicalized, only their redirects are followed with a HEAD request, dish names must be close to the
+    saved name, see SAVED_DISTANCE)
+    :param library: the recipe library; RecipeLibrary
+    :param entered_dish_name: the dish name or URL; str
+    :return: the library result; dict (name, path, url, saved), None if not saved
+    """
+    from canonical_url import canonicalize, resolve_redirects
+    url = entry_to_url(entered_dish_name)
+    if url is None:
+        from matching import normalize
+        return library.find(entered_dish_name, int(len(normalize(entered_dish_name)) * SAVED_DISTANCE))
+
+    saved = library.lookup_url(url)
+    if saved is None:
+        final_url = resolve_redirects(canonicalize(url))
+        saved = library.lookup_url(final_url)
+        if saved is not None:  # remember this link so the next lookup needs no network at all
+            library.add_url(url, saved["path"])
+    return saved
+
+
+def convert(entered_dish_name, library=None):
+    """
+    Gets the recipe for a dish name or URL using "generate_html.py"
+    :param entered_dish_name: the dish name or URL; str
+    :param library: (optional) library of already imported links, their pages are not downloaded; RecipeLibrary
+    :return: three-tuple (name, recipe, url), or error code (0, -1, -2, -3)
+    """
+    from generate_html import url_to_recipe, name_to_recipe
+    url = entry_to_url(entered_dish_name)
+    if url is None:  # gets (file name, recipe, url) from dish name
+        with stage("name_to_recipe", entered_dish_name):
+            return name_to_recipe(entered_dish_name,
+                                  known_recipe=None if library is None else library.recipe_for_url)
+    with stage("url_to_recipe", url):
+        return url_to_recipe(url)  # gets (file name, recipe, url) from url
+
+
+def store(recipes_path, entered_dish_name, val, library):
+    """
+    Saves a converted recipe, unless its canonical link shows it was already imported
+    :param recipes_path: recipe storage directory; str
+    :param entered_dish_name: the dish name or URL that was converted; str
+    :param val: three-tuple (name, recipe, url) from convert
+    :param library: the recipe library; RecipeLibrary
+    :return: two-tuple (path of the recipe file, True if it was already saved)
+    """
+    saved = library.lookup_url(val[2])
+    url = entry_to_url(entered_dish_name)
+    if saved is not None:
+        full_path, already_saved = saved["path"], True
+    else:
+        full_path, already_saved = save_recipe(recipes_path, *val, library=library), False
+    if url is not None:  # the entered link may differ from the canonical one
+        library.add_url(url, full_path)
+    return full_path, already_saved
+
+
+def save_recipe(recipes_path, name, cleaned_recipe, url=None, library=None):
+    """
+    Writes the recipe HTML without overriding existing files (" (copy)" is added to the name instead)
+    :param recipes_path: recipe storage directory; str
+    :param name: the file name without extension; str
+    :param cleaned_recipe: the standardized recipe dictionary
+    :param url: (optional) the web link of the recipe; str
+    :param library: (optional) library to add the recipe to; RecipeLibrary
+    :return: path of the written file; str
+    """
+    from render_html import write_minimized_html
+    with save_lock:
+        full_path = path.join(recipes_path, name + ".html")
+        while path.isfile(full_path):  # ensure no file override
+            name = name + " (copy)"
+            full_path = path.join(recipes_path, name + ".html")
+        f = open(full_path, "w+", encoding="utf-16")
+    with f, stage("render + write", full_path):  # finally, write the HTML data
+        write_minimized_html(cleaned_recipe, f)
+    if library is not None:
+        with stage("library", full_path):
+            library.add(cleaned_recipe, full_path, url)
+    return full_path
+
+
+# EXPORT FUNCTIONS
+def export_library(library, file_path):
+    """
+    Writes every recipe of the library to a binary store (see recipe_store.py)
+    :param library: the recipe library; RecipeLibrary
+    :param file_path: path of the store; str
+    :return: number of recipes exported; int
+    """
+    from recipe_store import export_recipes
+    with stage("export", file_path):
+        return export_recipes(((recipe, path.splitext(path.basename(html_path))[0], url, saved)
+                               for recipe, html_path, url, saved in library.entries()), file_path)
+
+
+def import_store(recipes_path, library, file_path):
+    """
+    Saves every recipe of a binary store (see recipe_store.py) that is not in the library yet
+    :param recipes_path: recipe storage directory; str
+    :param library: the recipe library; RecipeLibrary
+    :param file_path: path of the store; str
+    :return: two-tuple (number of recipes saved, number already in the library)
+    """
+    from recipe_store import RecipeStore
+    saved = skipped = 0
+    with stage("import", file_path), RecipeStore(file_path) as recipes:
+        for index in range(len(recipes)):
+            file, url, _ = recipes.info(index)
+            recipe = recipes.recipe(index)
+            from generate_html import file_name
+            # names come from the store: prohibited characters replaced, so that they stay in the recipe directory
+            file = path.basename(file_name(recipe if file is None else {"name": file}))
+            if ((url is not None and library.lookup_url(url) is not None)  # already imported
+                    or library.load(path.join(recipes_path, file + ".html")) == recipe):  # same recipe, no link
+                skipped += 1
+                continue
+            save_recipe(recipes_path, file, recipe, url, library)
+            saved += 1
+    return saved, skipped
+
+
+# REFRESH FUNCTIONS
+def rewrite_recipe(full_path, cleaned_recipe, url, library):
+    """
+    Replaces the HTML file and library entry of a saved recipe (the file keeps its name)
+    :param full_path: path of the saved HTML file; str
+    :param cleaned_recipe: the new standardized recipe dictionary
+    :param url: the web link of the recipe; str
+    :param library: the recipe library; RecipeLibrary
+    :return: None
+    """
+    from os import replace
+    from render_html import write_minimized_html
+    temp_path = full_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-16") as f, stage("render + write", full_path):
+        write_minimized_html(cleaned_recipe, f)
+    replace(temp_path, full_path)  # the old page stays complete until the new one is
+    with stage("library", full_path):
+        library.add(cleaned_recipe, full_path, url)
+
+
+def refresh_entry(library, cleaned_recipe, full_path, url):
+    """
+    Re-checks one saved recipe against its web page, its files are rewritten only if the recipe changed
+    :param library: the recipe library; RecipeLibrary
+    :param cleaned_recipe: the saved standardized recipe dictionary
+    :param full_path: path of the saved HTML file; str
+    :param url: the web link of the recipe; str
+    :return: "not modified" (the server answered 304), "unchanged" (page changed, recipe did not), "updated",
+             "missing" (HTML file deleted, removed from the library) or the error code of url_to_recipe; str or int
+    """
+    from generate_html import recheck_recipe
+    if not path.isfile(full_path):  # saved file was deleted by the user
+        library.remove(full_path)
+        return "missing"
+    with stage("refresh", url):
+        val, validators = recheck_recipe(url, *library.validators(full_path))
+    if val is None:
+        return "not modified"
+    if type(val) is not tuple:
+        return val
+    status = "unchanged"
+    if val[1] != cleaned_recipe:
+        rewrite_recipe(full_path, val[1], url, library)
+        status = "updated"
+    library.set_validators(full_path, *validators)  # the next refresh only downloads newer versions
+    return status
+
+
+def configure_browsers(workers, options):
+    """
+    Sizes the browser pool for the worker threads: one browser per worker, at most get_html_selenium.MAX_BROWSERS
+    unless --browsers is given
+    :param workers: number of worker threads; int
+    :param options: given options; dict (option -> value or True)
+    :return: None
+    """
+    import get_html_selenium
+    get_html_selenium.configure_pool(int(options.get("--browsers", min(workers, get_html_selenium.MAX_BROWSERS))))
+
+
+def refresh_library(library, workers=16):
+    """
+    Re-checks every saved recipe that has a web link with conditional requests, in parallel
+    :param library: the recipe library; RecipeLibrary
+    :param workers: number of recipes checked at the same time (the scheduler still limits each website); int
+    :return: status -> number of recipes, see refresh_entry; dict
+    """
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+
+    def process(entry):
+        cleaned_recipe, full_path, url, _ = entry
+        try:
+            status = refresh_entry(library, cleaned_recipe, full_path, url)
+        except Exception as e:  # unhandled exception, recorded for this recipe only
+            print('"{}": unexpected error ({}: {})'.format(full_path, type(e).__name__, e))
+            return "error"
+        if status == "updated":
+            print("Updated {}".format(full_path))
+        elif type(status) is int:
+            print('"{}": {}'.format(full_path, ERROR_MESSAGES[status].format(url)))
+        return status
+
+    entries = [entry for entry in library.entries() if entry[2]]  # manual recipes have no web link
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return Counter(status if type(status) is str else "error" for status in executor.map(process, entries))
+
+
+# BATCH FUNCTIONS
+def read_batch(source):
+    """
+    Reads the entries of a batch file, one dish name or URL per line (empty lines and # comments are skipped)
+    :param source: path of the batch file, "-" for stdin; str
+    :return: list of entries; list of str
+    """
+    if source == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(source, encoding="utf-8") as f:
+            lines = f.readlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+
+def run_batch(entries, recipes_path, library, workers=4, online=False):
+    """
+    Converts and saves every entry with a bounded worker pool, errors only affect their own entry
+    :param entries: list of dish names or URLs; list of str
+    :param recipes_path: recipe storage directory; str
+    :param library: library to look up entries in and add saved recipes to; RecipeLibrary
+    :param workers: number of entries processed at the same time; int
+    :param online: always search the websites, even if the library has the dish; bool
+    :return: summary of the run; dict
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from time import perf_counter
+
+    def process(entry):
+        start = perf_counter()
+        result = {"entry": entry}
+        try:
+            saved = None if online else find_saved(library, entry)
+            val = None if saved is not None else convert(entry, library)
+            if saved is not None:  # already in the library, no network
+                result["path"] = saved["path"]
+                result["library"] = True
+            elif type(val) is tuple:
+                result["path"], result["library"] = store(recipes_path, entry, val, library)
+            else:
+                result["error_code"] = val
+        except Exception as e:  # unhandled exception, recorded for this entry only
+            result["error"] = "{}: {}".format(type(e).__name__, e)
+        result["seconds"] = round(perf_counter() - start, 3)
+        return result
+
+    start = perf_counter()
+    results = [None] * len(entries)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process, entry): i for i, entry in enumerate(entries)}
+        for done, future in enumerate(as_completed(futures), 1):
+            result = results[futures[future]] = future.result()
+            if result.get("library"):
+                status = "already saved at {}".format(result["path"])
+            elif "path" in result:
+                status = "saved to {}".format(result["path"])
+            elif "error_code" in result:
+                status = ERROR_MESSAGES[result["error_code"]].format(result["entry"])
+            else:
+                status = "unexpected error ({})".format(result["error"])
+            print('[{}/{}] "{}": {} ({:.1f}s)'.format(done, len(entries), result["entry"], status,
+                                                     result["seconds"]))
+
+    successes = [r for r in results if "path" in r]
+    return {"total": len(results), "succeeded": len(successes), "failed": len(results) - len(successes),
+            "seconds": round(perf_counter() - start, 3),
+            "error_codes": {str(code): sum(1 for r in results if r.get("error_code") == code)
+                            for code in ERROR_MESSAGES},
+            "results": results}
+
+
+# STATISTICS
+def print_stats():
+    """
+    Prints request timings (http_client.py), cache use (http_cache.py), browser use (render_detection.py) and website
+    lookups (recipe_finder.py)
+    :return: None
+    """
+    import http_client
+    import http_cache
+    import render_detection
+    import recipe_finder
+    import scheduler
+    print("\nRequests: " + http_client.format_stats())
+    print("Scheduler:\n" + scheduler.format_stats())
+    print("Cache: {hits} fresh hits, {revalidated} revalidated, {downloads} downloads".format(**http_cache.stats))
+    print("Browser: {static_hits} static hits, {static_misses} static misses, {browser_runs} browser runs "
+          "({browser_direct} without static download, {browser_rechecks} rechecks), {browser_skipped} skipped"
+          .format(**render_detection.stats))
+    print("Websites:\n" + recipe_finder.format_stats())
+
+
 # MAIN
 def main(args):
     """
@@ -27,28 +383,115 @@ def main(args):
     :param args: list of arguments; [Link or Name of dish / "manual", Options]
     :return: None
     """
-    from os import getcwd
-    from os import path
     recipes_path = getcwd()  # recipe storage directory
 
     # ARGUMENT HANDLING
     if len(args) == 0:  # User entered "?" or no arguments
-        print("Usage:\n  recipe.py <command> [options]")
+        print("Usage:\n  recipe.py <command> [options]\n  recipe.py --batch <file> [options]")
         print("\nCommands:\n  dish name: finds the recipe based on the name of the dish\n  "
               "Web URL: extracts recipe from given (full) URL\n  "
               "manual: enters manual mode, asks for recipe")
-        print("\nOptions:\n  --open: automatically open the recipe in your web browser")
+        print("\nOptions:\n  --open: automatically open the recipe in your web browser\n  "
+              "--no-cache: do not use or update the cache of downloaded pages\n  "
+              "--online: search the websites even if the dish is already saved in your library\n  "
+              "--search: list saved recipes whose name, ingredients or instructions contain the words\n  "
+              "--stats: print request timings, cache and browser statistics when done\n  "
+              "--profile: print the time spent in each stage (download, parsing, rendering...) when done\n  "
+              "--cprofile <file>: save a cProfile of the run (all threads) to the file\n  "
+              "--metrics <file>: append one JSON line per finished stage to the file\n  "
+              "--batch <file>: convert every dish name or URL in the file (one per line, - for stdin)\n  "
+              "--workers <n>: number of batch entries converted at the same time (default 4, 16 for --refresh)\n  "
+              "--browsers <n>: number of browsers rendering pages at the same time in a batch or refresh (default: "
+              "one per worker, at most 4)\n  "
+              "--summary <file>: where to write the JSON summary of a batch (default batch_summary.json)\n  "
+              "--rate <n>: requests started per second on each website (default 2, 0 for no limit)\n  "
+              "--refresh: re-check every saved recipe with its web page, rewrite the ones that changed\n  "
+              "--export <file>: write every saved recipe to a binary store\n  "
+              "--import <file>: save the recipes of a binary store that are not in your library yet")
+        return
+
+    words, options = parse_options(args)
+    if "--no-cache" in options:  # always use the network
+        import http_cache
+        http_cache.enabled = False
+    if "--rate" in options:  # requests per second per website
+        import scheduler
+        scheduler.configure(rate=float(options["--rate"]) or None)
+
+    if "--profile" in options or "--metrics" in options:  # per-stage timings
+        instrumentation.enable(options.get("--metrics"))
+    if "--cprofile" in options:  # function level profile of the main thread and of every worker thread
+        instrumentation.start_profile()
+
+    try:
+        with stage("total"):
+            run(words, options, recipes_path)
+    finally:
+        if "--cprofile" in options:
+            instrumentation.stop_profile(options["--cprofile"])
+            print("\ncProfile data saved to {} (view with python -m pstats)".format(options["--cprofile"]))
+        instrumentation.disable()
+        if "--profile" in options:  # print the per-stage breakdown, even if the run failed
+            print("\n" + instrumentation.report())
+        if "--stats" in options:  # print network statistics, even if the run failed
+            print_stats()
+
+
+def run(words, options, recipes_path):
+    """
+    Runs a command (dish name, URL, manual, search, refresh, export, import or batch)
+    :param words: non-option arguments; list of str
+    :param options: given options; dict (option -> value or True)
+    :param recipes_path: recipe storage directory; str
+    :return: None
+    """
+    entered_dish_name = " ".join(words)
+    arg = "%20".join(words)
+    from library import RecipeLibrary
+    open_recipe = "--open" in options  # open recipe flag
+    library = RecipeLibrary(recipes_path)
+
+    if "--search" in options:  # offline search of the library
+        results = library.search(entered_dish_name)
+        for result in results:
+            print("{}: {}".format(result["name"], result["path"]))
+        if not results:
+            print('No saved recipes match "{}"'.format(entered_dish_name))
         return
 
-    if args[-1] == "--open":  # User wants to open recipe after creation
-        entered_dish_name = " ".join(args[:-1])
-        arg = "%20".join(args[:-1])
-        open_recipe = True  # set open recipe flag
+    if "--refresh" in options:  # update saved recipes whose web page changed
+        from time import perf_counter
+        start = perf_counter()
+        workers = int(options.get("--workers", 16))
+        configure_browsers(workers, options)
+        counts = refresh_library(library, workers=workers)
+        print("Checked {} saved recipes in {:.1f}s: {} not modified, {} unchanged, {} updated, {} failed, "
+              "{} missing".format(sum(counts.values()), perf_counter() - start, counts["not modified"],
+                                  counts["unchanged"], counts["updated"], counts["error"], counts["missing"]))
+        return
 
-    else:  # no options given
-        entered_dish_name = " ".join(args)
-        arg = "%20".join(args)
-        open_recipe = False  # unset open recipe flag
+    if "--export" in options:  # binary store of the whole library
+        count = export_library(library, options["--export"])
+        print("Exported {} recipes to {}".format(count, options["--export"]))
+        return
+
+    if "--import" in options:  # save the recipes of a binary store
+        saved, skipped = import_store(recipes_path, library, options["--import"])
+        print("Imported {} recipes from {} ({} already in your library)".format(saved, options["--import"], skipped))
+        return
+
+    if "--batch" in options:  # batch mode, convert every entry of the file
+        entries = read_batch(options["--batch"])
+        workers = int(options.get("--workers", 4))
+        configure_browsers(workers, options)
+        summary = run_batch(entries, recipes_path, library, workers=workers, online="--online" in options)
+        summary_path = path.join(recipes_path, options.get("--summary", "batch_summary.json"))
+        import json
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print("Converted {} of {} entries in {:.1f}s, summary saved to {}".format(
+            summary["succeeded"], summary["total"], summary["seconds"], summary_path))
+        return
 
     if arg.upper() == "MANUAL":  # manual recipe creation
         name_ = input("Enter name of dish: ")
@@ -60,50 +503,39 @@ def main(args):
                    "cookTime": input("Enter cook time: "), "totalTime": input("Enter total time: "),
                    "recipeIngredients": input("Enter ingredients (; seperated): ").split(";"),
                    "recipeInstructions": input("Enter instructions (; seperated): ").split(";")}
-        full_path = path.join(recipes_path, cleaned["name"] + ".html")
-        with open(full_path, "w+") as f:
-            f.writelines(create_minimized_html(cleaned))  # create minimized html
-        exit()
-
-    # URL HANDLING (stored in "url", url = None if getting from dish name)
-    if "http" in arg:
-        url = arg  # store in "url"
-        if "www.google.com" in arg:  # handle google redirect URL
-            url = google_url_cleaner(url)
-    else:  # user inputted dish name, get URL from name
-        url = None
+        full_path = save_recipe(recipes_path, cleaned["name"], cleaned, library=library)  # create minimized html
+        print("Saved recipe to {}".format(full_path))
+        return
+
+    # LIBRARY LOOKUP (no page downloads)
+    entry = arg if "http" in arg else entered_dish_name
+    saved = None if "--online" in options else find_saved(library, entry)
+    if saved is not None:
+        print('Found "{}" in your library: {}'.format(saved["name"], saved["path"]))
+        print("(use --online to search the websites anyway)")
+        if open_recipe:  # open file if flag is set
+            from webbrowser import open_new
+            open_new("file://{}".format(saved["path"]))
+        return
 
     # EXPORTING TO HTML USING "generate_html.py"
     try:
-        if url is None:
-            val = name_to_html(entered_dish_name)  # gets (file name, HTML) from dish name
-        else:
-            val = url_to_html(url)  # gets (file name, HTML) from url
+        val = convert(entry, library)
     except Exception as e:  # unhandled exception
         print("An unexpected error occurred while retrieving page")
         print(e)
-        exit()
-
-    if val == 0:  # error code 0: find recipe in webpage error
-        print("We could not find a recipe there")
-        exit()
-    elif val == -1:  # error code -1: parsing recipe error
-        print("We could not parse the recipe")
-        exit()
-    elif val == -2:  # error code -2: dish name error
-        print('We could not find the dish "{}"'.format(entered_dish_name))
-    elif val == -3:  # error code -3: network error
-        print("Network error")
+        return
+
+    if type(val) is not tuple:  # error codes 0, -1, -2, -3
+        print(ERROR_MESSAGES[val].format(entered_dish_name))
     else:  # no unhandled or handled errors
-        name, data = val
-        full_path = path.join(recipes_path, name + ".html")
-        while path.isfile(full_path):  # ensure no file override
-            name = name + " (copy)"
-            full_path = path.join(recipes_path, name + ".html")
-        with open(full_path, "w+", encoding="utf-16") as f:  # finally, write the HTML data
-            f.writelines(data)
-            if open_recipe:  # open file if flag is set
-                open_new("file://{}".format(full_path))
+        full_path, already_saved = store(recipes_path, entry, val, library)
+        if open_recipe:  # open file if flag is set
+            from webbrowser import open_new
+            open_new("file://{}".format(full_path))
+        if already_saved:
+            print("This recipe was already saved to {}".format(full_path))
+        else:
             print("Saved recipe to {}".format(full_path))
 
 
@@ -116,4 +548,3 @@ if __name__ == "__main__":
     except Exception as er:
         print("Unknown error (fatal)")
         print(er)
-
@@ -1,38 +1,262 @@
-import requests
+import re
+from html import unescape
+from threading import Lock
+from time import time
+import http_cache
+import matching
+
+# search pages of the websites, {} is replaced by the dish name
+NYT_SEARCH = "https://cooking.nytimes.com/search?q={}"
+ALLRECIPES_SEARCH = "https://www.allrecipes.com/search?q={}"
+RECIPETINEATS_SEARCH = "https://www.recipetineats.com/?s={}"
+SERIOUSEATS_SEARCH = "https://www.seriouseats.com/search?q={}"
+
+# one search result: group 1 is the link, group 2 the HTML inside the link (title); each pattern starts with a literal
+# so that the regular expression engine can jump between results
+NYT_RESULT = re.compile(r'href="(/recipes/\d[^"]*)"[^>]*>(.*?)</a>', re.DOTALL)
+ALLRECIPES_RESULT = re.compile(r'data-tax-levels\s+href="(https://www\.allrecipes\.com/(?!gallery/)[^"]+)"'
+                               r'[^>]*>(.*?)</a>', re.DOTALL)  # galleries are not recipes
+RECIPETINEATS_RESULT = re.compile(r'entry-title\b[^>]*>\s*<a\b[^>]*?\bhref="(https://www\.recipetineats\.com/[^"]*?)/?"'
+                                  r'[^>]*>(.*?)</a>', re.DOTALL)
+SERIOUSEATS_RESULT = re.compile(r'class="card\b[^>]*?\bhref="(https://www\.seriouseats\.com/[^"]+)"[^>]*>(.*?)</a>',
+                                re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]*>")
+RESULTS = 5  # search results read per website, ranked by title before any recipe page is downloaded
+TITLE_MARGIN = 2  # recipe pages are downloaded only for results this close to the best title of all websites
+SEARCH_WAIT = 5  # seconds a website waits for the search results of the others before downloading its recipe page
+
+STATS_FILE = "finder_stats.json"  # per-website lookup statistics, kept across runs in the cache directory
+OUTCOMES = ("recipe", "no recipe", "no results", "error", "skipped")  # results of a lookup, see record()
+FAILURE_THRESHOLD = 3  # errors in a row that open the circuit breaker of a website (it is skipped)
+COOLDOWN = 10 * 60  # seconds before a website with an open circuit breaker is tried again
+MIN_LOOKUPS = 20  # lookups before a website whose results rarely win is searched only when the others fail
+MIN_WIN_RATE = 0.05  # share of lookups won below which a website is searched only when the others fail
+EXPLORE_EVERY = 10  # those websites still join every n-th search so their win rate can recover
+
+FINDERS = {}  # website -> Finder, in registration order (breaks ties when ranking)
+
+_lock = Lock()
+_stats = None  # {website: {"lookups", "recipe", "no recipe", "no results", "error", "wins", "seconds", "failures",
+#                           "opened"}}
+_plans = 0  # searches planned since start-up
+
+
+class Finder:
+    """
+    A website that can be searched for a dish name
+    """
+    def __init__(self, website, search_url, parse):
+        """
+        :param website: the domain of the website (e.g. www.allrecipes.com); str
+        :param search_url: the search page, {} is replaced by the dish name; str
+        :param parse: function taking the HTML of the search page and returning a list of (link, title)
+        """
+        self.website = website
+        self.search_url = search_url
+        self.parse = parse
+
+    def results(self, dish):
+        """
+        Takes a dish name and returns the first search results of the website
+        :param dish: the dish name; str
+        :return: list of (link, title) in the order of the search page, empty if no results
+        """
+        return self.parse(http_cache.get(self.search_url.format(dish)))
+
+    def link(self, dish):
+        """
+        Takes a dish name and returns the first recipe link of the website
+        :param dish: the dish name; str
+        :return: recipe link; str, if no results return None
+        """
+        results = self.results(dish)
+        return results[0][0] if results else None
+
+    def __repr__(self):
+        return "Finder({!r})".format(self.website)
+
+
+def register(website, search_url, parse):
+    """
+    Adds a website to the ones searched by generate_html.name_to_recipe and async_api.aname_to_html
+    :param website: the domain of the website (e.g. www.allrecipes.com); str
+    :param search_url: the search page, {} is replaced by the dish name; str
+    :param parse: function taking the HTML of the search page and returning a list of (link, title)
+    :return: the registered finder; Finder
+    """
+    finder = FINDERS[website] = Finder(website, search_url, parse)
+    return finder
+
+
+# STATISTICS AND ORDERING
+def _load():
+    """
+    Get the lookup statistics, reads them from disk on first use (must hold _lock)
+    :return: the statistics; dict
+    """
+    global _stats
+    if _stats is None:
+        _stats = http_cache.load_json(STATS_FILE)
+    return _stats
+
+
+def _site(website):
+    """
+    Get the statistics of a website, created on first use (must hold _lock)
+    :param website: the domain of the website; str
+    :return: the statistics; dict
+    """
+    site = _load().get(website)
+    if site is None:
+        site = _stats[website] = dict.fromkeys(("lookups", "wins", "seconds", "failures", "opened") + OUTCOMES, 0)
+    return site
+
+
+def _is_open(site, now):
+    """
+    Checks the circuit breaker of a website (must hold _lock)
+    :param site: the statistics of the website; dict
+    :param now: the current time; float
+    :return: True while the website is skipped, after COOLDOWN one lookup is let through; bool
+    """
+    return site["failures"] >= FAILURE_THRESHOLD and now - site["opened"] < COOLDOWN
+
+
+def _rank(site):
+    """
+    Sort key of a website, best first: most lookups won, then fastest
+    :param site: the statistics of the website; dict
+    :return: sort key; tuple
+    """
+    win_rate = (site["wins"] + 1) / (site["lookups"] + 2)  # unknown websites start at 1/2
+    latency = site["seconds"] / site["lookups"] if site["lookups"] else 0
+    return -win_rate, latency
+
+
+def plan():
+    """
+    Get the order in which to search the websites for one dish name
+    :return: three-tuple (first, fallback, skipped) of lists of Finder -- the websites to search first, best first,
+             the websites whose results rarely win (searched only if the first ones have no recipe) and the websites
+             whose circuit breaker is open (all websites are searched first if every circuit breaker is open)
+    """
+    global _plans
+    now = time()
+    with _lock:
+        _plans += 1
+        explore = _plans % EXPLORE_EVERY == 0
+        sites = {website: _site(website) for website in FINDERS}
+        skipped = [finder for finder in FINDERS.values() if _is_open(sites[finder.website], now)]
+        if len(skipped) == len(FINDERS):  # nothing else to try
+            skipped = []
+        ranked = sorted((finder for finder in FINDERS.values() if finder not in skipped),
+                        key=lambda finder: _rank(sites[finder.website]))  # stable: registration order breaks ties
+    first, fallback = [], []
+    for finder in ranked:
+        site = sites[finder.website]
+        rare = site["lookups"] >= MIN_LOOKUPS and site["wins"] < site["lookups"] * MIN_WIN_RATE
+        (fallback if rare and not explore else first).append(finder)
+    return first, fallback, skipped
+
+
+def outcome(link, val):
+    """
+    Get the outcome of a lookup from its result
+    :param link: the recipe link found on the website, or None; str
+    :param val: the converted recipe (tuple), the error code of generate_html.py or None if the recipe page was not
+                downloaded (other websites have closer titles); tuple or int
+    :return: one of OUTCOMES; str
+    """
+    if val is None:
+        return "skipped"
+    if type(val) is tuple:
+        return "recipe"
+    if link is not None:
+        return "no recipe"
+    return "no results" if val == -2 else "error"
+
+
+def record(website, outcome, seconds):
+    """
+    Adds one lookup to the statistics of a website, errors in a row open its circuit breaker
+    :param website: the domain of the website; str
+    :param outcome: "recipe", "no recipe" (link found but not converted), "no results", "error" (including
+                    time-outs) or "skipped" (recipe page not downloaded); str
+    :param seconds: duration of the lookup; float
+    :return: None
+    """
+    with _lock:
+        site = _site(website)
+        site["lookups"] += 1
+        site[outcome] = site.get(outcome, 0) + 1  # statistics saved before an outcome was added lack it
+        site["seconds"] += seconds
+        if outcome == "error":
+            site["failures"] += 1
+            if site["failures"] >= FAILURE_THRESHOLD:  # (re)open, also after the trial lookup of a cooldown
+                site["opened"] = time()
+        else:
+            site["failures"] = 0
+
+
+def win(website):
+    """
+    Counts a lookup whose result was chosen as the closest one
+    :param website: the domain of the website; str
+    :return: None
+    """
+    with _lock:
+        _site(website)["wins"] += 1
+
+
+def save():
+    """
+    Writes the statistics to STATS_FILE (nothing is written with the cache disabled)
+    :return: None
+    """
+    with _lock:
+        http_cache.save_json(STATS_FILE, _load())
+
+
+def use_stats(stats):
+    """
+    Replaces the statistics in memory and restarts the plan count, the saved statistics are not read
+    :param stats: {website: statistics}; dict
+    :return: None
+    """
+    global _stats, _plans
+    with _lock:
+        _stats = {website: dict(site) for website, site in stats.items()}
+        _plans = 0
+
+
+def format_stats():
+    """
+    Get a per-website summary of the lookups
+    :return: printable summary; str
+    """
+    now = time()
+    lines = []
+    with _lock:
+        for website in FINDERS:
+            site = _site(website)
+            lookups = site["lookups"] or 1
+            lines.append("  {}: {} lookups, {:.0%} recipes, {:.0%} won, avg {:.2f}s, {} errors{}".format(
+                website, site["lookups"], site["recipe"] / lookups, site["wins"] / lookups, site["seconds"] / lookups,
+                site["error"], " (circuit open)" if _is_open(site, now) else ""))
+    return "\n".join(lines)
 
 
 def levenshtein(str_a, str_b, caps=False):
     """
-    Calculates similarity of two strings using their Levenshtein distance
+    Calculates similarity of two strings using their Levenshtein distance (see matching.py for normalized matching)
     :param str_a: the first string; String
     :param str_b: the second string; String
     :param caps: case-sensitive?; Boolean; default = False
     :return: the Levenshtein distance; Float
     """
     if not caps:
-        return levenshtein(str_a, str_b, caps=True)
-
-    m = len(str_a)
-    n = len(str_b)
-    d = [[0] * (n + 1) for _ in range(m + 1)]
-
-    for i in range(1, m + 1):
-        d[i][0] = i
-
-    for j in range(1, n + 1):
-        d[0][j] = j
-
-    for j in range(1, n + 1):
-        for i in range(1, m + 1):
-            if str_a[i - 1] == str_b[j - 1]:
-                cost = 0
-            else:
-                cost = 1
-            d[i][j] = min(d[i - 1][j] + 1,  # deletion
-                          d[i][j - 1] + 1,  # insertion
-                          d[i - 1][j - 1] + cost)  # substitution
-
-    return d[m][n]
+        str_a, str_b = str_a.casefold(), str_b.casefold()
+    return matching.distance(str_a, str_b)
 
 
 # LINK FROM DISH NAME FUNCTIONS - TAKE DISH NAME AND RETURN LINK, IF NO LINK FOUND THEN RETURN NONE
@@ -42,21 +266,7 @@ def get_nyt_link(dish):
     :param dish: the dish name; str
     :return: recipe link; str, if no results return None
     """
-    agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:110.0) Gecko/20100101 Firefox/110.0'
-
-    url_nyt = "https://cooking.nytimes.com/search?q={}".format(dish)
-    r = requests.get(url_nyt, headers={'User-Agent': agent})
-    html = r.text
-    start = html.find('href="/recipes')
-    i = start
-    while html[i] != ">":
-        i += 1
-
-    url = "https://cooking.nytimes.com"+html[start+6:i-1]
-    if url[27] != "/":  # no results from NYT
-        return None
-    else:
-        return url
+    return FINDERS["cooking.nytimes.com"].link(dish)
 
 
 def get_allrecipes_link(dish):
@@ -65,30 +275,7 @@ def get_allrecipes_link(dish):
     :param dish: the dish name; str
     :return: recipe link; str, if no results return None
     """
-    agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:110.0) Gecko/20100101 Firefox/110.0'
-
-    url_allr = "https://www.allrecipes.com/search?q={}".format(dish)
-    r = requests.get(url_allr, headers={'User-Agent': agent})
-
-    html = r.text
-    url = "gallery"
-    i = 0
-
-    while "gallery" in url:
-        html = html[i + 5:]
-        start = html.find('data-tax-levels href="')
-        i = start
-        x = 0
-        while x < 2:
-            if html[i] == '"':
-                x += 1
-            i += 1
-        url = html[start+22:i-1]
-
-    if "/" not in url:  # no results from NYT
-        return None
-    else:
-        return url
+    return FINDERS["www.allrecipes.com"].link(dish)
 
 
 def get_recipetineats_link(dish):
@@ -97,20 +284,7 @@ def get_recipetineats_link(dish):
     :param dish: the dish name; str
     :return: recipe link; str, if no results return None
     """
-    agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:110.0) Gecko/20100101 Firefox/110.0'
-
-    url = "https://www.recipetineats.com/?s={}".format(dish)
-    r = requests.get(url, headers={'User-Agent': agent})
-
-    html = r.text
-    html = html[html.find("Search Results for")+50:]
-    html = html[html.find("Search Results for"):]
-    html = html[html.find("href="):]
-    html = html[6:html.find('/"')]
-    if html == "https://www.recipetineats.com/nagi-recipetin-eats":
-        return None
-    else:
-        return html
+    return FINDERS["www.recipetineats.com"].link(dish)
 
 
 def get_seriouseats_link(dish):
@@ -119,13 +293,96 @@ def get_seriouseats_link(dish):
     :param dish: the dish name; str
     :return: recipe link; str, if no results return None
     """
-    agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:110.0) Gecko/20100101 Firefox/110.0'
+    return FINDERS["www.seriouseats.com"].link(dish)
+
+
+# SEARCH PAGE PARSERS - TAKE THE HTML OF A SEARCH PAGE AND RETURN THE FIRST RESULTS, IF NO RESULTS THEN RETURN []
+def title_text(html):
+    """
+    Get the text of the HTML inside a search result link
+    :param html: the HTML code; str
+    :return: the text, tags removed and whitespace collapsed; str
+    """
+    return " ".join(unescape(TAG_PATTERN.sub(" ", html)).split())
+
+
+def parse_results(html, pattern, limit=RESULTS, prefix=""):
+    """
+    Finds the first search results of a search page in one pass, a link repeated in the page counts once
+    :param html: the search page; str
+    :param pattern: regular expression of one result (group 1 link, group 2 title); re.Pattern
+    :param limit: (optional) maximum number of results; int
+    :param prefix: (optional) added in front of every link (e.g. the website for relative links); str
+    :return: list of (link, title) in the order of the page
+    """
+    results = []
+    seen = set()
+    for match in pattern.finditer(html):
+        link = prefix + match.group(1)
+        if link in seen:
+            continue
+        if len(results) == limit:
+            break
+        seen.add(link)
+        results.append((link, title_text(match.group(2))))
+    return results
+
+
+def parse_nyt_results(html, limit=RESULTS):
+    """
+    Finds the first recipe results of a NYT Cooking search page
+    :param html: the search page; str
+    :param limit: (optional) maximum number of results; int
+    :return: list of (link, title), empty if no results
+    """
+    return parse_results(html, NYT_RESULT, limit, "https://cooking.nytimes.com")
+
+
+def parse_allrecipes_results(html, limit=RESULTS):
+    """
+    Finds the first recipe results (galleries skipped) of an All Recipes search page
+    :param html: the search page; str
+    :param limit: (optional) maximum number of results; int
+    :return: list of (link, title), empty if no results
+    """
+    return parse_results(html, ALLRECIPES_RESULT, limit)
+
+
+def parse_recipetineats_results(html, limit=RESULTS):
+    """
+    Finds the first recipe results of a Recipe Tin Eats search page
+    :param html: the search page; str
+    :param limit: (optional) maximum number of results; int
+    :return: list of (link, title), empty if no results
+    """
+    return parse_results(html, RECIPETINEATS_RESULT, limit)
+
+
+def parse_seriouseats_results(html, limit=RESULTS):
+    """
+    Finds the first recipe results of a Serious Eats search page
+    :param html: the search page; str
+    :param limit: (optional) maximum number of results; int
+    :return: list of (link, title), empty if no results
+    """
+    return parse_results(html, SERIOUSEATS_RESULT, limit)
+
+
+def best_result(dish, results):
+    """
+    Get the search result whose title is closest to the dish name (see matching.rank)
+    :param dish: the dish name; str
+    :param results: list of (link, title)
+    :return: three-tuple (similarity score, link, title), None if there are no results
+    """
+    if not results:
+        return None
+    score, index = matching.rank(dish, [title for link, title in results])[0]
+    return (score,) + results[index]
 
-    url = "https://www.seriouseats.com/search?q={}".format(dish)
-    r = requests.get(url, headers={'User-Agent': agent})
 
-    html = r.text
-    html = html[html.find('href="https://www.seriouseats.com/about-us-5120006#toc-contact-us"')+50:]
-    html = html[html.find("href")+6:]
-    html = html[:html.find('">')]
-    return html
+# REGISTRY - default order is the order of registration
+register("www.recipetineats.com", RECIPETINEATS_SEARCH, parse_recipetineats_results)
+register("www.allrecipes.com", ALLRECIPES_SEARCH, parse_allrecipes_results)
+register("cooking.nytimes.com", NYT_SEARCH, parse_nyt_results)
+register("www.seriouseats.com", SERIOUSEATS_SEARCH, parse_seriouseats_results)
@@ -0,0 +1,257 @@
+import mmap
+import struct
+import sys
+from array import array
+from collections import Counter
+from os import path, replace
+
+# Binary export of standardized recipe dictionaries, read in place with mmap (see README "Export")
+#
+# header: MAGIC, then "<IIII" version, number of recipes, number of strings, number of sections, then one "<QQ"
+# (offset, length) per section of SECTIONS; every section starts on an 8 byte boundary
+# strings: every text is stored once (interned), recipes refer to it by its index in the string table
+MAGIC = b"RECIPES\0"
+VERSION = 1
+HEADER = struct.Struct("<IIII")
+SECTION = struct.Struct("<QQ")
+TEXT_FIELDS = ("name", "articleBody", "cookTime", "totalTime", "recipeYield")  # one string per recipe
+LIST_FIELDS = ("recipeIngredients", "recipeInstructions")  # list of strings per recipe
+INFO_FIELDS = ("file", "url")  # file name without extension and web link of the saved recipe
+NONE = 0xFFFFFFFF  # string index of a missing value (e.g. recipes entered manually have no web link)
+# sections: string offsets (u32, strings + 1), UTF-8 string data, one u32 column per text and info field, saved time
+# (f64 column), then for every list field its item offsets (u32, recipes + 1) and items (u32 string indexes)
+SECTIONS = (("string offsets", "strings") + TEXT_FIELDS + INFO_FIELDS + ("saved",)
+            + tuple(name for field in LIST_FIELDS for name in (field + " offsets", field)))
+
+
+def _little_endian(values):
+    """
+    Get the little endian bytes of a typed array
+    :param values: the values; array.array
+    :return: the bytes; bytes
+    """
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _column(data, typecode, views):
+    """
+    Get a little endian column of a store without copying it (copied on big endian machines only)
+    :param data: the bytes of the column; memoryview
+    :param typecode: "I" for u32 or "d" for f64; str
+    :param views: memory views to release before the file is closed, the new one is added; list
+    :return: the values; memoryview or array.array
+    """
+    if sys.byteorder == "little":
+        views.append(data.cast(typecode))
+        return views[-1]
+    values = array(typecode, data)
+    values.byteswap()
+    return values
+
+
+def export_recipes(entries, file_path):
+    """
+    Writes recipes to a binary store, the file is replaced only once it is complete
+    :param entries: iterable of (standardized recipe dictionary, file name without extension or None, web link or
+                    None, saved time or None)
+    :param file_path: path of the store; str
+    :return: number of recipes written; int
+    """
+    assert array("I").itemsize == 4, "u32 columns need a 4 byte array type"
+    interned = {}  # text -> string index
+    columns = {name: array("I") for name in TEXT_FIELDS + INFO_FIELDS}
+    saved_times = array("d")
+    offsets = {field: array("I", [0]) for field in LIST_FIELDS}
+    items = {field: array("I") for field in LIST_FIELDS}
+
+    def intern(value):
+        if value is None:
+            return NONE
+        text = str(value)
+        index = interned.get(text)
+        if index is None:
+            index = interned[text] = len(interned)
+        return index
+
+    count = 0
+    for recipe, file, url, saved in entries:
+        for field in TEXT_FIELDS:
+            columns[field].append(intern(recipe.get(field)))
+        columns["file"].append(intern(file))
+        columns["url"].append(intern(url))
+        saved_times.append(saved or 0)
+        for field in LIST_FIELDS:
+            items[field].extend(intern(item) for item in recipe.get(field) or ())
+            offsets[field].append(len(items[field]))
+        count += 1
+
+    string_offsets = array("I", [0])
+    encoded = []
+    size = 0
+    for text in interned:  # dictionaries keep insertion order: position = string index
+        data = text.encode("utf-8", "surrogatepass")
+        encoded.append(data)
+        size += len(data)
+        string_offsets.append(size)
+    if size >= NONE:
+        raise ValueError("recipe store strings are limited to 4 GB")
+
+    sections = {"string offsets": _little_endian(string_offsets), "strings": b"".join(encoded),
+                "saved": _little_endian(saved_times)}
+    sections.update((name, _little_endian(column)) for name, column in columns.items())
+    for field in LIST_FIELDS:
+        sections[field + " offsets"] = _little_endian(offsets[field])
+        sections[field] = _little_endian(items[field])
+
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        position = len(MAGIC) + HEADER.size + SECTION.size * len(SECTIONS)
+        table = []
+        for name in SECTIONS:
+            position += -position % 8
+            table.append(SECTION.pack(position, len(sections[name])))
+            position += len(sections[name])
+        f.write(MAGIC + HEADER.pack(VERSION, count, len(interned), len(SECTIONS)) + b"".join(table))
+        for name in SECTIONS:
+            f.write(b"\0" * (-f.tell() % 8))
+            f.write(sections[name])
+    replace(temp_path, file_path)
+    return count
+
+
+class RecipeStore:
+    """
+    Read-only view of a binary store written by export_recipes: the file is memory mapped, recipes and strings are
+    only decoded when they are used, so scans over one column (e.g. ingredient counts) never build the recipes
+    """
+    def __init__(self, file_path):
+        """
+        :param file_path: path of the store; str
+        :raise ValueError: if the file is not a recipe store of this version
+        """
+        with open(file_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if path.getsize(file_path) else b""
+        data = memoryview(self._map)
+        self._views = [data]  # released in reverse order by close(), the memory map cannot be closed before
+        if bytes(data[:len(MAGIC)]) != MAGIC or len(data) < len(MAGIC) + HEADER.size:
+            self.close()
+            raise ValueError("{} is not a recipe store".format(file_path))
+        version, self._count, strings, sections = HEADER.unpack_from(data, len(MAGIC))
+        if version != VERSION or sections != len(SECTIONS):
+            self.close()
+            raise ValueError("{} is a recipe store of an unsupported version ({})".format(file_path, version))
+
+        self._sections = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(data, len(MAGIC) + HEADER.size + SECTION.size * i)
+            self._sections[name] = data[offset:offset + length]
+            self._views.append(self._sections[name])
+        self._string_offsets = _column(self._sections["string offsets"], "I", self._views)
+        self._columns = {name: _column(self._sections[name], "I", self._views)
+                         for name in TEXT_FIELDS + INFO_FIELDS + LIST_FIELDS}
+        self._columns.update((field + " offsets", _column(self._sections[field + " offsets"], "I", self._views))
+                             for field in LIST_FIELDS)
+        self._saved = _column(self._sections["saved"], "d", self._views)
+        self._decoded = [None] * strings  # strings decoded so far, by string index
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, index):
+        """
+        Get a string of the string table, decoded on first use
+        :param index: the string index; int
+        :return: the string, None for NONE; str
+        """
+        if index == NONE:
+            return None
+        text = self._decoded[index]
+        if text is None:
+            text = self._decoded[index] = str(self._sections["strings"][self._string_offsets[index]:
+                                                                       self._string_offsets[index + 1]],
+                                              "utf-8", "surrogatepass")
+        return text
+
+    def _items(self, field, index):
+        """
+        Get the string indexes of a list field of one recipe
+        :param field: one of LIST_FIELDS; str
+        :param index: position of the recipe in the store; int
+        :return: the string indexes; list of int
+        """
+        offsets = self._columns[field + " offsets"]
+        return self._columns[field][offsets[index]:offsets[index + 1]].tolist()
+
+    def recipe(self, index):
+        """
+        Get one recipe
+        :param index: position of the recipe in the store; int
+        :return: the standardized recipe dictionary
+        """
+        if not 0 <= index < self._count:
+            raise IndexError("recipe index out of range")
+        recipe = {field: self.string(self._columns[field][index]) for field in TEXT_FIELDS}
+        for field in LIST_FIELDS:
+            recipe[field] = [self.string(item) for item in self._items(field, index)]
+        return recipe
+
+    def info(self, index):
+        """
+        Get where a recipe came from
+        :param index: position of the recipe in the store; int
+        :return: three-tuple (file name without extension, web link, saved time), missing values are None
+        """
+        if not 0 <= index < self._count:
+            raise IndexError("recipe index out of range")
+        return (self.string(self._columns["file"][index]), self.string(self._columns["url"][index]),
+                self._saved[index] or None)
+
+    def __iter__(self):
+        return (self.recipe(index) for index in range(self._count))
+
+    def column(self, field):
+        """
+        Get one text field of every recipe (e.g. totalTime), each distinct value is decoded once
+        :param field: one of TEXT_FIELDS or INFO_FIELDS; str
+        :return: the values in store order; list of str
+        """
+        return [self.string(index) for index in self._columns[field]]
+
+    def counts(self, field="recipeIngredients"):
+        """
+        Counts how often every item of a list field occurs over all recipes, without building the recipes
+        :param field: (optional) one of LIST_FIELDS; str
+        :return: item -> number of occurrences; collections.Counter
+        """
+        counts = Counter(self._columns[field])
+        return Counter({self.string(index): count for index, count in counts.items()})
+
+    def html(self, index):
+        """
+        Regenerates the HTML page of one recipe
+        :param index: position of the recipe in the store; int
+        :return: the final HTML markdown; list (see render_html.create_minimized_html)
+        """
+        from render_html import create_minimized_html
+        return create_minimized_html(self.recipe(index))
+
+    def close(self):
+        """
+        Releases the memory map, recipes and strings already returned stay valid
+        :return: None
+        """
+        self._sections = self._columns = {}
+        self._string_offsets = self._saved = None
+        while self._views:
+            self._views.pop().release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
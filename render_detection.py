@@ -0,0 +1,118 @@
+from threading import Lock
+from time import time
+from urllib.parse import urlparse
+import http_cache
+import instrumentation
+import json_ld
+
+DECISIONS_FILE = "render_decisions.json"  # per-domain decisions, kept across runs in the cache directory
+DECISION_TTL = 7 * 24 * 60 * 60  # seconds a decision is used, then the domain is detected again
+RECHECK_EVERY = 20  # on a domain known to be static, every 20th page without recipe data is rendered anyway
+
+# how often the browser really has to run (printed by recipe.py --stats)
+stats = {"static_hits": 0,  # static page already had recipe data, no browser
+         "static_misses": 0,  # static page had no recipe data
+         "browser_runs": 0,  # pages rendered in the browser
+         "browser_direct": 0,  # of those, static download skipped because the domain is known to need JS
+         "browser_skipped": 0,  # static miss on a domain known to be static, browser not started
+         "browser_rechecks": 0}  # static miss on a domain known to be static, rendered to check the decision
+
+_lock = Lock()
+_decisions = None  # {domain: [True if the domain needs JS rendering else False, time decided]}
+_misses = {}  # {domain: static misses of a domain known to be static}, see recheck()
+
+
+def domain_of(url):
+    """
+    Get the domain of a web link
+    :param url: the web link; str
+    :return: the domain (e.g. www.allrecipes.com); str
+    """
+    return urlparse(url).netloc.lower()
+
+
+def has_recipe_data(html):
+    """
+    Cheap pre-scan for recipe structured data, nothing is parsed
+    :param html: the HTML code; str
+    :return: True if the page contains a "@type": "Recipe" object; bool
+    """
+    return json_ld.RECIPE_TYPE_PATTERN.search(html) is not None
+
+
+def _load():
+    """
+    Get the domain decisions, reads them from disk on first use (must hold _lock)
+    :return: the domain decisions; dict
+    """
+    global _decisions
+    if _decisions is None:
+        _decisions = http_cache.load_json(DECISIONS_FILE)
+    return _decisions
+
+
+def needs_browser(url):
+    """
+    Get the known decision for the domain of a web link
+    :param url: the web link; str
+    :return: True if the domain needs JS rendering, False if it does not, None if unknown or older than DECISION_TTL
+    """
+    with _lock:
+        decision = _load().get(domain_of(url))
+    if not isinstance(decision, list) or time() - decision[1] > DECISION_TTL:  # bool: saved without a time
+        return None
+    return decision[0]
+
+
+def recheck(url):
+    """
+    Whether a page without recipe data on a domain known to be static is rendered anyway, every RECHECK_EVERY-th
+    one is: a domain that moved its recipes to JS is detected before its decision expires
+    :param url: the web link; str
+    :return: True if the page must be rendered; bool
+    """
+    domain = domain_of(url)
+    with _lock:
+        _misses[domain] = _misses.get(domain, 0) + 1
+        due = _misses[domain] % RECHECK_EVERY == 0
+    count("browser_rechecks" if due else "browser_skipped")
+    return due
+
+
+def record(url, needs_js):
+    """
+    Remembers whether the domain of a web link needs JS rendering
+    :param url: the web link; str
+    :param needs_js: True if the recipe was only found after rendering; bool
+    :return: None
+    """
+    domain = domain_of(url)
+    now = time()
+    with _lock:
+        decision = _load().get(domain)
+        if isinstance(decision, list) and decision[0] == needs_js and now - decision[1] < DECISION_TTL / 2:
+            return  # not written again for every page
+        _decisions[domain] = [needs_js, now]
+        http_cache.save_json(DECISIONS_FILE, _decisions)
+
+
+def use_decisions(decisions):
+    """
+    Replaces the domain decisions in memory, the saved ones are not read (benchmark.py starts without any)
+    :param decisions: {domain: [needs JS rendering, time decided]}; dict
+    :return: None
+    """
+    global _decisions
+    with _lock:
+        _decisions = dict(decisions)
+
+
+def count(name):
+    """
+    Increments one of the counters in stats, and the instrumentation counter of the same name (recipe.py --profile)
+    :param name: the counter name; str
+    :return: None
+    """
+    with _lock:
+        stats[name] += 1
+    instrumentation.count(name)
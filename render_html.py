@@ -0,0 +1,87 @@
+import re
+from html import escape, unescape
+from os import path
+from functools import lru_cache
+
+TEMPLATE_PATH = path.join(path.dirname(path.abspath(__file__)), "recipe", "single-recipe-template.html")
+FIELD_PLACEHOLDERS = {"name", "articleBody", "cookTime", "totalTime", "recipeYield"}  # (placeholder) in template
+PLACEHOLDER_PATTERN = re.compile(r"\(({})\)".format("|".join(sorted(FIELD_PLACEHOLDERS))))
+
+
+@lru_cache(maxsize=None)
+def compile_template(template_path=TEMPLATE_PATH):
+    """
+    Parses the HTML template once into a render plan, later calls with the same path reuse the plan
+    :param template_path: path of the HTML template; str
+    :return: render plan, list of literal template text (str) and slots (tuple with the slot name)
+    """
+    with open(template_path, encoding="utf-8") as f:
+        lines = f.readlines()
+
+    plan = []
+    literal = []
+    for line in lines:
+        if "<!-- start instructions -->" in line:  # whole line is replaced by the instructions
+            plan.extend(["".join(literal), ("recipeInstructions",)])
+            literal = []
+        elif "<!-- start ingredients -->" in line:  # whole line is replaced by the ingredients
+            plan.extend(["".join(literal), ("recipeIngredients",)])
+            literal = []
+        else:
+            for piece in PLACEHOLDER_PATTERN.split(line):  # odd pieces are placeholder names
+                if piece in FIELD_PLACEHOLDERS:
+                    plan.extend(["".join(literal), (piece,)])
+                    literal = []
+                else:
+                    literal.append(piece)
+    plan.append("".join(literal))
+    return [chunk for chunk in plan if chunk != ""]
+
+
+def escape_value(value):
+    """
+    Escapes a recipe value for HTML, entities already present in the value are not escaped twice
+    :param value: the recipe value
+    :return: the escaped text; str
+    """
+    return escape(unescape(str(value)), quote=False)
+
+
+def iter_minimized_html(cleaned_recipe, template_path=TEMPLATE_PATH):
+    """
+    Renders the standardized dictionary with the compiled template, chunk by chunk
+    :param cleaned_recipe: the standardized recipe dictionary
+    :param template_path: (optional) path of the HTML template; str
+    :return: generator of HTML chunks; str
+    """
+    for chunk in compile_template(template_path):
+        if type(chunk) is str:  # literal template text
+            yield chunk
+        elif chunk[0] == "recipeInstructions":  # instructions (loop through list)
+            for i, instruction in enumerate(cleaned_recipe["recipeInstructions"]):
+                yield '<div class="single-instruction"><header><p>step {}</p><div></div></header><p>{}</p></div>'\
+                    .format(i + 1, escape_value(instruction))
+        elif chunk[0] == "recipeIngredients":  # ingredients (loop through list)
+            for ingredient in cleaned_recipe["recipeIngredients"]:
+                yield '<p class="single-ingredient">{}</p>'.format(escape_value(ingredient))
+        else:  # name, articleBody, cookTime, totalTime, recipeYield
+            yield escape_value(cleaned_recipe[chunk[0]])
+
+
+def create_minimized_html(cleaned_recipe):
+    """
+    Takes standardized dictionary and returns HTML, requires HTML file template in "recipe/single-recipe-template.html"
+    :param cleaned_recipe: the standardized recipe dictionary
+    :return: the final HTML markdown; list
+    """
+    return ["".join(iter_minimized_html(cleaned_recipe))]
+
+
+def write_minimized_html(cleaned_recipe, f):
+    """
+    Streams the HTML of a standardized dictionary straight to a file object
+    :param cleaned_recipe: the standardized recipe dictionary
+    :param f: text file object to write to
+    :return: None
+    """
+    f.writelines(iter_minimized_html(cleaned_recipe))
@@ -0,0 +1,505 @@
+import asyncio
+import requests
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from threading import Condition, Lock
+from time import monotonic, time
+from urllib.parse import urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+enabled = True  # set to False to send requests as soon as they are made (no limits, no robots.txt)
+MAX_ACTIVE = 16  # requests running at the same time over all hosts
+HOST_CONCURRENCY = 2  # requests running at the same time per host
+HOST_RATE = 2.0  # requests started per second per host, None for no limit
+host_limits = {}  # {host: (concurrency, requests per second)} overriding the two defaults above
+ROBOTS_TTL = 24 * 60 * 60  # seconds a robots.txt is used before it is downloaded again
+ROBOTS_FILE = "robots.json"  # robots.txt of every host, kept across runs in the cache directory of http_cache.py
+MAX_RETRY_AFTER = 5 * 60  # longest Retry-After honoured, in seconds
+BUSY_STATUSES = (429, 503)  # responses asking to come back later, retried by http_client.py after the wait
+BUSY_DELAY = 1.0  # seconds to wait after a busy response without a valid Retry-After header
+
+
+class RobotsDisallowed(requests.exceptions.RequestException):
+    """
+    The robots.txt of the website does not allow the request
+    """
+
+
+class _Host:
+    """
+    Scheduling state of one host
+    """
+    def __init__(self, concurrency, rate):
+        self.concurrency = concurrency
+        self.interval = 1 / rate if rate else 0  # seconds between two request starts
+        self.waiting = deque()  # tickets of the threads waiting for this host, first come first served
+        self.active = 0
+        self.next_start = 0  # monotonic time before which no request may start (rate, Retry-After, Crawl-delay)
+        self.robots = None  # (RobotFileParser, time it was downloaded)
+        self.robots_loading = False  # one thread downloads robots.txt, the others wait for it
+        # metrics
+        self.granted = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+        self.max_queue = 0
+        self.retry_after = 0
+
+
+_condition = Condition()
+_hosts = {}  # host -> _Host
+_turns = deque()  # hosts with waiting requests, in round robin order
+_active = 0
+_wakers = []  # (event loop, asyncio.Event) of the coroutines waiting in aslot()
+
+_robots_lock = Lock()
+_saved_robots = None  # {host: {"fetched", "status", "lines"}} of the downloaded robots.txt, loaded on first use
+
+
+def _host(host):
+    """
+    Get the state of a host, created on first use (must hold _condition)
+    :param host: the host (e.g. www.allrecipes.com); str
+    :return: the host state; _Host
+    """
+    state = _hosts.get(host)
+    if state is None:
+        state = _hosts[host] = _Host(*host_limits.get(host, (HOST_CONCURRENCY, HOST_RATE)))
+    return state
+
+
+def _next_turn(now):
+    """
+    Get the host whose first waiting request may start now, hosts take turns (must hold _condition)
+    :param now: monotonic time; float
+    :return: the host, None if no request may start now; str
+    """
+    if _active >= MAX_ACTIVE:
+        return None
+    for host in _turns:
+        state = _hosts[host]
+        if state.active < state.concurrency and state.next_start <= now:
+            return host
+    return None
+
+
+def _notify():
+    """
+    Wakes every thread and coroutine waiting for a slot, e.g. after a slot was released (must hold _condition)
+    :return: None
+    """
+    _condition.notify_all()
+    for loop, wake in _wakers:
+        loop.call_soon_threadsafe(wake.set)
+
+
+def _enqueue(host, ticket):
+    """
+    Adds a request to the line of a host (must hold _condition)
+    :param host: the host; str
+    :param ticket: identifies the request; object
+    :return: None
+    """
+    state = _host(host)
+    state.waiting.append(ticket)
+    state.max_queue = max(state.max_queue, len(state.waiting))
+    if host not in _turns:
+        _turns.append(host)
+
+
+def _dequeue(host, ticket):
+    """
+    Removes a request that stopped waiting (e.g. a cancelled coroutine) from the line of a host (must hold _condition)
+    :param host: the host; str
+    :param ticket: identifies the request; object
+    :return: None
+    """
+    state = _hosts[host]
+    state.waiting.remove(ticket)
+    if not state.waiting and host in _turns:
+        _turns.remove(host)
+    _notify()
+
+
+def _take(host, ticket, start, charge):
+    """
+    Takes the slot of a waiting request if it may start now (must hold _condition)
+    :param host: the host; str
+    :param ticket: identifies the request; object
+    :param start: monotonic time the request started waiting; float
+    :param charge: False if the request does not count against the rate of the host; bool
+    :return: two-tuple (True if the slot was taken, seconds until the earliest rate limit expires or None to wait for a
+             slot to be released)
+    """
+    global _active
+    state = _hosts[host]
+    now = monotonic()
+    if state.waiting[0] is not ticket or _next_turn(now) != host:
+        delays = [_hosts[h].next_start - now for h in _turns if _hosts[h].next_start > now]
+        return False, min(delays) if delays else None
+
+    state.waiting.popleft()
+    state.active += 1
+    _active += 1
+    if charge:
+        state.next_start = max(state.next_start, now) + state.interval
+    _turns.remove(host)
+    if state.waiting:  # back of the line, the other hosts go first
+        _turns.append(host)
+    waited = now - start
+    state.granted += 1
+    state.waited += waited
+    state.max_wait = max(state.max_wait, waited)
+    _notify()
+    return True, None
+
+
+def _acquire(host, charge=True):
+    """
+    Waits until a request to a host may start, then takes its slot
+    :param host: the host; str
+    :param charge: (optional) False if the request does not count against the rate of the host; bool
+    :return: None
+    """
+    ticket = object()
+    start = monotonic()
+    with _condition:
+        _enqueue(host, ticket)
+        while True:
+            taken, timeout = _take(host, ticket, start, charge)
+            if taken:
+                return
+            # sleep until the earliest moment a rate limit expires, or until a slot is released
+            _condition.wait(timeout)
+
+
+async def _aacquire(host, charge=True):
+    """
+    Asynchronous _acquire(), the event loop keeps running while the request waits
+    :param host: the host; str
+    :param charge: (optional) False if the request does not count against the rate of the host; bool
+    :return: None
+    """
+    ticket = object()
+    start = monotonic()
+    waker = (asyncio.get_running_loop(), asyncio.Event())
+    taken = False
+    with _condition:
+        _enqueue(host, ticket)
+        _wakers.append(waker)
+    try:
+        while True:
+            with _condition:
+                taken, timeout = _take(host, ticket, start, charge)
+                if taken:
+                    return
+                waker[1].clear()  # set again by the next _notify()
+            try:
+                await asyncio.wait_for(waker[1].wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _condition:
+            _wakers.remove(waker)
+            if not taken:  # cancelled, do not hold up the requests behind this one
+                _dequeue(host, ticket)
+
+
+def _release(host, retry_after=None):
+    """
+    Gives back the slot of a finished request
+    :param host: the host; str
+    :param retry_after: (optional) seconds the server asked to wait before the next request; float
+    :return: None
+    """
+    global _active
+    with _condition:
+        state = _hosts[host]
+        state.active -= 1
+        _active -= 1
+        if retry_after:
+            state.next_start = max(state.next_start, monotonic() + min(retry_after, MAX_RETRY_AFTER))
+            state.retry_after += 1
+        _notify()
+
+
+def busy(response):
+    """
+    Tells whether a response should be retried once the scheduler has waited for its host (429 or 503, see
+    retry_after_seconds), never while the scheduler is disabled
+    :param response: the response; requests.Response or httpx.Response
+    :return: True to send the request again; bool
+    """
+    return enabled and response.status_code in BUSY_STATUSES
+
+
+def retry_after_seconds(response):
+    """
+    Get the delay asked for by a 429 or 503 response
+    :param response: the response; requests.Response or httpx.Response
+    :return: seconds to wait from its Retry-After header (BUSY_DELAY without a valid one), None for other responses;
+             float
+    """
+    if response is None or response.status_code not in BUSY_STATUSES:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return BUSY_DELAY
+    try:
+        return max(float(value), 0)
+    except ValueError:  # HTTP date
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time(), 0)
+        except (TypeError, ValueError):
+            return BUSY_DELAY
+
+
+class Slot:
+    """
+    A started request, see slot(); set response so that its Retry-After header is honoured
+    """
+    response = None
+
+
+@contextmanager
+def slot(url, charge=True):
+    """
+    Waits for the limits of the host of a web link (concurrency, rate, Retry-After), the slot is held until the
+    with block ends (e.g. while a streamed body is read)
+    :param url: the web link; str
+    :param charge: (optional) False if the request does not delay the next request to the host (e.g. robots.txt);
+                   bool
+    :return: context manager giving a Slot
+    """
+    if not enabled:
+        yield Slot()
+        return
+    host = urlsplit(url).netloc.lower()
+    _acquire(host, charge)
+    current = Slot()
+    try:
+        yield current
+    finally:
+        _release(host, retry_after_seconds(current.response))
+
+
+@asynccontextmanager
+async def aslot(url, charge=True):
+    """
+    Asynchronous slot(), for requests sent from an event loop (see async_api.afetch)
+    :param url: the web link; str
+    :param charge: (optional) False if the request does not delay the next request to the host; bool
+    :return: asynchronous context manager giving a Slot
+    """
+    if not enabled:
+        yield Slot()
+        return
+    host = urlsplit(url).netloc.lower()
+    await _aacquire(host, charge)
+    current = Slot()
+    try:
+        yield current
+    finally:
+        _release(host, retry_after_seconds(current.response))
+
+
+def _load_robots():
+    """
+    Get the saved robots.txt of every host, reads them from disk on first use (must hold _robots_lock)
+    :return: {host: {"fetched", "status", "lines"}}; dict
+    """
+    import http_cache  # http_cache uses http_client, which uses this module for every request
+    global _saved_robots
+    if _saved_robots is None:
+        _saved_robots = http_cache.load_json(ROBOTS_FILE)
+    return _saved_robots
+
+
+def _save_robots(host, saved):
+    """
+    Remembers the robots.txt of a host, written to disk unless the cache is disabled (recipe.py --no-cache)
+    :param host: the host; str
+    :param saved: {"fetched": time it was downloaded, "status": response status, "lines": lines of the body}; dict
+    :return: None
+    """
+    import http_cache
+    with _robots_lock:
+        _load_robots()[host] = saved
+        http_cache.save_json(ROBOTS_FILE, _saved_robots)
+
+
+def use_robots(robots):
+    """
+    Replaces the saved robots.txt in memory and forgets the parsed ones, the file is not read (with an empty dict
+    every robots.txt is downloaded again)
+    :param robots: {host: {"fetched", "status", "lines"}}; dict
+    :return: None
+    """
+    global _saved_robots
+    with _robots_lock:
+        _saved_robots = dict(robots)
+    with _condition:
+        for state in _hosts.values():
+            state.robots = None
+
+
+def _parse_robots(robots_url, status, lines):
+    """
+    Get the rules of a robots.txt response, same rules as RobotFileParser.read()
+    :param robots_url: the robots.txt web link; str
+    :param status: the response status; int
+    :param lines: lines of the body; list of str
+    :return: the rules; RobotFileParser
+    """
+    rules = RobotFileParser(robots_url)
+    if status in (401, 403):
+        rules.disallow_all = True
+    elif status < 400:
+        rules.parse(lines)
+    else:  # no robots.txt, nothing is disallowed
+        rules.allow_all = True
+    return rules
+
+
+def _known_robots(state):
+    """
+    Get the robots.txt rules of a host if they are in memory and were downloaded less than ROBOTS_TTL ago
+    (must hold _condition)
+    :param state: the host state; _Host
+    :return: the rules, None if robots.txt must be read again; RobotFileParser
+    """
+    if state.robots is not None and time() - state.robots[1] < ROBOTS_TTL:
+        return state.robots[0]
+    return None
+
+
+def _robots(url):
+    """
+    Get the robots.txt rules of the host of a web link, downloaded at most once per ROBOTS_TTL (also across runs,
+    see ROBOTS_FILE), the download does not count against the rate of the host
+    :param url: the web link; str
+    :return: the rules; RobotFileParser
+    """
+    import http_client  # http_client uses this module for every request
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    with _condition:
+        state = _host(host)
+        while state.robots_loading:
+            _condition.wait()
+        if _known_robots(state) is not None:
+            return state.robots[0]
+        state.robots_loading = True
+
+    robots_url = urlunsplit((parts.scheme, parts.netloc, "/robots.txt", "", ""))
+    rules = None
+    fetched = time()
+    try:
+        with _robots_lock:
+            saved = _load_robots().get(host)
+        if saved is not None and fetched - saved["fetched"] < ROBOTS_TTL:  # saved by an earlier run
+            rules = _parse_robots(robots_url, saved["status"], saved["lines"])
+            fetched = saved["fetched"]
+        else:
+            with slot(robots_url, charge=False) as current:  # the first page of the host is not delayed by it
+                current.response = r = http_client.session().get(
+                    robots_url if http_client.url_rewriter is None else http_client.url_rewriter(robots_url),
+                    timeout=http_client.TIMEOUT)
+            lines = r.text.splitlines() if r.status_code < 400 else []
+            rules = _parse_robots(robots_url, r.status_code, lines)
+            _save_robots(host, {"fetched": fetched, "status": r.status_code, "lines": lines})
+    except requests.exceptions.RequestException:  # no robots.txt available, nothing is disallowed
+        pass
+    finally:
+        if rules is None:  # also used if anything above failed unexpectedly
+            rules = RobotFileParser(robots_url)
+            rules.allow_all = True
+        with _condition:
+            state.robots = (rules, fetched)
+            state.robots_loading = False
+            delay = rules.crawl_delay(http_client.USER_AGENT)
+            if delay:  # Crawl-delay: slower than the default rate only
+                state.interval = max(state.interval, float(delay))
+            _notify()
+    return rules
+
+
+def check_robots(url):
+    """
+    Raises RobotsDisallowed if the robots.txt of the website does not allow the web link
+    :param url: the web link; str
+    :return: None
+    """
+    if not enabled or urlsplit(url).path == "/robots.txt":
+        return
+    import http_client
+    if not _robots(url).can_fetch(http_client.USER_AGENT, url):
+        raise RobotsDisallowed("robots.txt of {} does not allow {}".format(urlsplit(url).netloc, url))
+
+
+async def acheck_robots(url):
+    """
+    Asynchronous check_robots(), robots.txt is read or downloaded in the default executor when it is not in memory
+    :param url: the web link; str
+    :return: None
+    """
+    if not enabled or urlsplit(url).path == "/robots.txt":
+        return
+    import http_client
+    with _condition:
+        state = _hosts.get(urlsplit(url).netloc.lower())
+        rules = None if state is None else _known_robots(state)
+    if rules is None:
+        await asyncio.get_running_loop().run_in_executor(None, check_robots, url)
+    elif not rules.can_fetch(http_client.USER_AGENT, url):
+        raise RobotsDisallowed("robots.txt of {} does not allow {}".format(urlsplit(url).netloc, url))
+
+
+def configure(max_active=None, concurrency=None, rate=False, limits=None):
+    """
+    Changes the limits, only hosts that have not been contacted yet use the new per-host defaults
+    :param max_active: (optional) requests running at the same time over all hosts; int
+    :param concurrency: (optional) default requests running at the same time per host; int
+    :param rate: (optional) default requests per second per host, None for no limit; float
+    :param limits: (optional) {host: (concurrency, requests per second)}; dict
+    :return: None
+    """
+    global MAX_ACTIVE, HOST_CONCURRENCY, HOST_RATE
+    with _condition:
+        if max_active is not None:
+            MAX_ACTIVE = max_active
+        if concurrency is not None:
+            HOST_CONCURRENCY = concurrency
+        if rate is not False:
+            HOST_RATE = rate
+        if limits:
+            host_limits.update(limits)
+            for host, (host_concurrency, host_rate) in limits.items():
+                if host in _hosts:
+                    _hosts[host].concurrency = host_concurrency
+                    _hosts[host].interval = 1 / host_rate if host_rate else 0
+        _notify()
+
+
+def stats():
+    """
+    Get the queue metrics of every host
+    :return: {host: {"queued", "active", "granted", "max_queue", "avg_wait", "max_wait", "retry_after"}}; dict
+    """
+    with _condition:
+        return {host: {"queued": len(state.waiting), "active": state.active, "granted": state.granted,
+                       "max_queue": state.max_queue, "avg_wait": state.waited / state.granted if state.granted else 0,
+                       "max_wait": state.max_wait, "retry_after": state.retry_after}
+                for host, state in _hosts.items()}
+
+
+def format_stats():
+    """
+    Get a per-host summary of queue depth and waiting times
+    :return: printable summary; str
+    """
+    lines = []
+    for host, s in sorted(stats().items()):
+        lines.append("  {}: {} started, {} queued now (max {}), wait avg {:.2f}s max {:.2f}s, {} Retry-After".format(
+            host, s["granted"], s["queued"], s["max_queue"], s["avg_wait"], s["max_wait"], s["retry_after"]))
+    return "\n".join(lines) if lines else "  no requests"
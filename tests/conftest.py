@@ -0,0 +1,35 @@
+import sys
+from os import path
+import pytest
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))  # the modules are not an installed package
+
+import http_cache  # noqa: E402
+import recipe_finder  # noqa: E402
+import render_detection  # noqa: E402
+import scheduler  # noqa: E402
+from fixture_server import FixtureServer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def offline_state(monkeypatch, tmp_path):
+    """
+    Every test starts from an empty state: the cache lives in a temporary directory and is disabled unless the test
+    enables it, no render decision, website statistic or robots.txt learned from the real websites is used
+    """
+    cache_dir = str(tmp_path / "cache")
+    monkeypatch.setattr(http_cache, "CACHE_DIR", cache_dir)
+    monkeypatch.setattr(http_cache, "_index", None)
+    monkeypatch.setattr(http_cache, "enabled", False)
+    render_detection.use_decisions({})
+    recipe_finder.use_stats({})
+    scheduler.use_robots({})
+
+
+@pytest.fixture
+def fixture_server():
+    """
+    The local stand-in of the recipe websites (fixtures/routes.json), installed for the test
+    """
+    with FixtureServer() as server:
+        yield server
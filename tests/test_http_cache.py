@@ -0,0 +1,72 @@
+from os import path
+import pytest
+import http_cache
+import http_client
+import scheduler
+
+RECIPE = "https://www.allrecipes.com/recipe/11973/spaghetti-carbonara-ii/"
+OTHER_RECIPES = ("https://cooking.nytimes.com/recipes/12965-spaghetti-carbonara",
+                 "https://www.seriouseats.com/how-to-make-carbonara-sauce-recipe")
+
+
+@pytest.fixture
+def cache(fixture_server, monkeypatch):
+    """
+    The cache enabled in the temporary directory of offline_state, with its counters reset
+    """
+    monkeypatch.setattr(http_cache, "enabled", True)
+    monkeypatch.setattr(http_cache, "stats", {"hits": 0, "revalidated": 0, "downloads": 0})
+    monkeypatch.setattr(scheduler, "enabled", False)  # the rate limits are tested in test_scheduler.py
+    return http_cache
+
+
+def entry(url):
+    return http_cache._load_index()[http_cache._key(url)]
+
+
+def test_fresh_hit(cache):
+    text = cache.get(RECIPE)
+    assert cache.get(RECIPE) == text
+    assert cache.stats == {"hits": 1, "revalidated": 0, "downloads": 1}
+
+
+def test_stale_entry_revalidated(cache, monkeypatch):
+    text = cache.get(RECIPE)
+    etag = entry(RECIPE)["etag"]
+    monkeypatch.setattr(cache, "ttl", 0)
+    assert cache.get(RECIPE) == text  # 304 Not Modified, body read from the cache
+    assert cache.stats == {"hits": 0, "revalidated": 1, "downloads": 1}
+    assert entry(RECIPE)["etag"] == etag
+
+
+def test_partial_entry(cache):
+    cache.get(RECIPE, until=lambda chunk: True)
+    assert entry(RECIPE)["complete"] is False
+    cache.get(RECIPE, until=lambda chunk: True)  # the beginning is enough again
+    assert cache.stats["hits"] == 1
+    text = cache.get(RECIPE)  # the whole page is needed: downloaded again
+    assert cache.stats["downloads"] == 2
+    assert entry(RECIPE)["complete"] is True
+    assert cache.get(RECIPE) == text
+
+
+def test_least_recently_used_evicted(cache, monkeypatch):
+    stale, recent = OTHER_RECIPES
+    cache.get(RECIPE)
+    cache.get(stale)
+    cache.get(RECIPE)  # used after stale
+    recent_size = len(http_client.get_text(recent)[1].encode("utf-8"))  # not cached
+    monkeypatch.setattr(cache, "max_size", entry(RECIPE)["size"] + recent_size)
+    cache.get(recent)  # room for one of the others: the one used least recently goes
+    index = cache._load_index()
+    assert cache._key(stale) not in index and not path.exists(cache._body_path(cache._key(stale)))
+    assert cache._key(RECIPE) in index and cache._key(recent) in index
+
+
+def test_flush_writes_access_times(cache):
+    cache.get(RECIPE)
+    cache.get(RECIPE)  # fresh hit: the access time is only changed in memory
+    accessed = entry(RECIPE)["accessed"]
+    assert cache.load_json(cache.INDEX_FILE)[cache._key(RECIPE)]["accessed"] < accessed
+    cache.flush()
+    assert cache.load_json(cache.INDEX_FILE)[cache._key(RECIPE)]["accessed"] == accessed
@@ -0,0 +1,28 @@
+import os
+import pytest
+import recipe_finder
+from benchmark import DISHES
+from generate_html import url_to_recipe
+
+# the fixtures are hand-written stand-ins of the websites, these tests check the parsers against the real ones
+pytestmark = pytest.mark.skipif(os.environ.get("RECIPE_LIVE_TESTS") != "1",
+                                reason="uses the real websites, set RECIPE_LIVE_TESTS=1 to run")
+
+
+@pytest.mark.parametrize("website", list(recipe_finder.FINDERS))
+def test_search_results(website):
+    finder = recipe_finder.FINDERS[website]
+    for dish in DISHES:
+        results = finder.results(dish)
+        assert results, "no results parsed from {}".format(finder.search_url.format(dish))
+        assert all(link.startswith("https://" + website + "/") for link, title in results)
+        score, link, title = recipe_finder.best_result(dish, results)
+        assert score <= len(dish) // 2, "closest title {!r} does not look like a recipe title".format(title)
+
+
+@pytest.mark.parametrize("website", list(recipe_finder.FINDERS))
+def test_recipe_page(website):
+    for dish in DISHES:
+        link = recipe_finder.FINDERS[website].link(dish)
+        val = url_to_recipe(link)
+        assert type(val) is tuple, "{} gave error code {}".format(link, val)
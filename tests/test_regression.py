@@ -0,0 +1,20 @@
+import benchmark
+import scheduler
+
+# offline regression suite of benchmark.py: fixtures/golden.json, stage throughput and start-up time
+
+
+def test_golden_results(fixture_server):
+    failures = benchmark.check_golden(benchmark.run_pipeline(list(benchmark.fixture_pages())))
+    assert not failures, "\n".join(failures)
+
+
+def test_stage_throughput(fixture_server, monkeypatch):
+    monkeypatch.setattr(scheduler, "enabled", False)  # measure the pipeline, not the rate limits
+    failures = benchmark.check_baseline(benchmark.time_stages(benchmark.fixture_pages()))
+    assert not failures, "\n".join(failures)
+
+
+def test_startup_budget():
+    failures = benchmark.check_startup()
+    assert not failures, "\n".join(failures)
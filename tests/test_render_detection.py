@@ -0,0 +1,23 @@
+from time import time
+import render_detection
+
+URL = "https://www.example.com/recipe"
+
+
+def test_decision_expires():
+    render_detection.record(URL, True)
+    assert render_detection.needs_browser(URL) is True
+    render_detection.use_decisions({"www.example.com": [True, time() - render_detection.DECISION_TTL - 1]})
+    assert render_detection.needs_browser(URL) is None
+
+
+def test_decision_without_time_is_unknown():
+    render_detection.use_decisions({"www.example.com": False})
+    assert render_detection.needs_browser(URL) is None
+
+
+def test_static_domain_rechecked(monkeypatch):
+    monkeypatch.setattr(render_detection, "_misses", {})
+    render_detection.record(URL, False)
+    due = [render_detection.recheck(URL) for _ in range(2 * render_detection.RECHECK_EVERY)]
+    assert due.count(True) == 2 and due[render_detection.RECHECK_EVERY - 1]
@@ -0,0 +1,141 @@
+import asyncio
+from collections import deque
+from threading import Thread
+from time import sleep, time
+import pytest
+import http_client
+import scheduler
+from fixture_server import FixtureServer
+
+PAGE = "<html><body>ok</body></html>"
+HOSTS = ("a.test", "b.test")
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """
+    A fresh scheduler without rate limit, set the limits to test; robots.txt of the test hosts allows everything
+    """
+    monkeypatch.setattr(scheduler, "_hosts", {})
+    monkeypatch.setattr(scheduler, "_turns", deque())
+    monkeypatch.setattr(scheduler, "host_limits", {})
+    monkeypatch.setattr(scheduler, "HOST_RATE", None)
+    scheduler.use_robots({host: {"fetched": time(), "status": 404, "lines": []} for host in HOSTS})
+    return monkeypatch
+
+
+def serve(tmp_path, urls, robots=None, **kwargs):
+    """
+    FixtureServer answering every web link with the same page
+    :param tmp_path: directory of the pages; pathlib.Path
+    :param urls: the web links; list of str
+    :param robots: (optional) robots.txt of a.test, the other hosts have none; str
+    :param kwargs: further arguments of FixtureServer (delay, busy); dict
+    :return: the server, not started; FixtureServer
+    """
+    (tmp_path / "page.html").write_text(PAGE, encoding="utf-8")
+    routes = {url: "page.html" for url in urls}
+    if robots is not None:
+        (tmp_path / "robots.txt").write_text(robots, encoding="utf-8")
+        routes["https://a.test/robots.txt"] = "robots.txt"
+    return FixtureServer(routes=routes, pages_path=str(tmp_path), **kwargs)
+
+
+def fetch_all(urls, spacing=0.0):
+    """
+    Downloads web links in parallel threads, started in the given order
+    :param urls: the web links; list of str
+    :param spacing: seconds between two thread starts, so that the requests are queued in order; float
+    :return: None
+    """
+    threads = [Thread(target=http_client.get_text, args=(url,), daemon=True) for url in urls]
+    for thread in threads:
+        thread.start()
+        sleep(spacing)
+    for thread in threads:
+        thread.join(10)  # a scheduler bug must fail the test, not hang it
+
+
+def most_at_once(log):
+    """
+    :param log: (web link, start, end) of the requests served; list
+    :return: largest number of requests the server answered at the same time; int
+    """
+    events = sorted([(start, 1) for _, start, _ in log] + [(end, -1) for _, _, end in log])
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    return peak
+
+
+def test_host_concurrency(limits, tmp_path):
+    limits.setattr(scheduler, "HOST_CONCURRENCY", 2)
+    urls = ["https://a.test/{}".format(i) for i in range(6)]
+    with serve(tmp_path, urls, delay=0.2) as server:
+        fetch_all(urls)
+    assert len(server.log) == 6
+    assert most_at_once(server.log) == 2
+
+
+def test_host_rate(limits, tmp_path):
+    limits.setattr(scheduler, "HOST_CONCURRENCY", 5)
+    limits.setattr(scheduler, "HOST_RATE", 5.0)
+    urls = ["https://a.test/{}".format(i) for i in range(5)]
+    with serve(tmp_path, urls) as server:
+        fetch_all(urls)
+    starts = sorted(start for _, start, _ in server.log)
+    assert all(later - earlier > 0.15 for earlier, later in zip(starts, starts[1:]))  # 0.2s apart, clock jitter
+
+
+def test_hosts_take_turns(limits, tmp_path):
+    limits.setattr(scheduler, "MAX_ACTIVE", 1)
+    urls = ["https://a.test/{}".format(i) for i in range(4)] + ["https://b.test/{}".format(i) for i in range(2)]
+    with serve(tmp_path, urls, delay=0.2) as server:
+        fetch_all(urls, spacing=0.02)  # a.test/0 runs while the others line up
+    order = [url for url, _, _ in sorted(server.log, key=lambda request: request[1])]
+    assert order == ["https://a.test/0", "https://a.test/1", "https://b.test/0", "https://a.test/2",
+                     "https://b.test/1", "https://a.test/3"]
+
+
+@pytest.mark.parametrize("retry_after, seconds", [("1", 1.0), (None, scheduler.BUSY_DELAY)])
+def test_busy_response_retried_after_wait(limits, tmp_path, retry_after, seconds):
+    url = "https://a.test/busy"
+    with serve(tmp_path, [url], busy={url: [retry_after]}) as server:
+        r, text, complete = http_client.get_text(url)
+    assert r.status_code == 200 and text == PAGE
+    (_, first, _), (_, second, _) = server.log
+    assert second - first >= seconds - 0.05
+    assert scheduler.stats()["a.test"]["retry_after"] == 1
+
+
+def test_robots_disallowed(limits, tmp_path):
+    scheduler.use_robots({})  # downloaded from the server
+    urls = ["https://a.test/private/page", "https://a.test/public/page"]
+    with serve(tmp_path, urls, robots="User-agent: *\nDisallow: /private\n") as server:
+        with pytest.raises(scheduler.RobotsDisallowed):
+            http_client.get_text(urls[0])
+        assert http_client.get_text(urls[1])[1] == PAGE
+    assert [url for url, _, _ in server.log] == ["https://a.test/robots.txt", urls[1]]
+
+
+def test_cancelled_request_leaves_the_line(limits):
+    limits.setattr(scheduler, "HOST_CONCURRENCY", 1)
+    url = "https://a.test/page"
+
+    async def take_slot():
+        async with scheduler.aslot(url):
+            pass
+
+    async def scenario():
+        async with scheduler.aslot(url):  # holds the only slot of the host
+            waiting = asyncio.ensure_future(take_slot())
+            await asyncio.sleep(0.05)
+            assert scheduler.stats()["a.test"]["queued"] == 1
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            assert scheduler.stats()["a.test"]["queued"] == 0
+        await asyncio.wait_for(take_slot(), 1)  # not held up by the cancelled request
+
+    asyncio.run(scenario())
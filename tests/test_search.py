@@ -0,0 +1,31 @@
+import asyncio
+import json
+from urllib.parse import urlparse
+import pytest
+import async_api
+import generate_html
+from fixture_server import FixtureServer, ROUTES_PATH
+
+# recipe pages whose search results have the closest titles are gone: the skipped pages must still be downloaded
+GONE = ("https://www.recipetineats.com/spaghetti-carbonara",
+        "https://cooking.nytimes.com/recipes/12965-spaghetti-carbonara")
+FALLBACK_HOSTS = ("www.allrecipes.com", "www.seriouseats.com")
+
+
+@pytest.fixture
+def closest_pages_gone():
+    with open(ROUTES_PATH, encoding="utf-8") as f:
+        routes = {url: page for url, page in json.load(f).items() if url not in GONE}
+    with FixtureServer(routes=routes) as server:
+        yield server
+
+
+def test_skipped_pages_downloaded(closest_pages_gone):
+    val = generate_html.name_to_recipe("spaghetti carbonara")
+    assert type(val) is tuple, "error code {}".format(val)
+    assert urlparse(val[2]).netloc in FALLBACK_HOSTS
+
+
+def test_skipped_pages_downloaded_async(closest_pages_gone):
+    result = asyncio.run(async_api.aname_to_html("spaghetti carbonara"))
+    assert urlparse(result.url).netloc in FALLBACK_HOSTS